@@ -0,0 +1,76 @@
+import threading
+import time
+
+########################################
+# Кэш балансов (chain_id, address) с привязкой к номеру блока.
+# Записи обновляются локально по отправленным нами транзакциям (value + газ)
+# и перечитываются из сети только если устарели (TTL в блоках) или затронуты.
+########################################
+DEFAULT_TTL_BLOCKS = 30     # запись считается свежей, пока сеть ушла не дальше чем на N блоков
+BLOCK_POLL_INTERVAL = 2.0   # как часто (сек) перечитывать eth_blockNumber для проверки TTL
+
+
+class BalanceEntry:
+    __slots__ = ("wei", "block", "dirty")
+
+    def __init__(self, wei, block):
+        self.wei = wei
+        self.block = block
+        self.dirty = False  # баланс изменён локальной оценкой и требует сверки с сетью
+
+
+class BalanceCache:
+    def __init__(self, ttl_blocks=DEFAULT_TTL_BLOCKS):
+        self.ttl_blocks = ttl_blocks
+        self.entries = {}
+        self.blocks = {}  # chain_id -> (номер блока, время запроса)
+        self.lock = threading.Lock()
+
+    def current_block(self, chain_id, w3):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.blocks.get(chain_id)
+            if cached and now - cached[1] < BLOCK_POLL_INTERVAL:
+                return cached[0]
+        block = w3.eth.block_number
+        with self.lock:
+            self.blocks[chain_id] = (block, now)
+        return block
+
+    def _is_fresh(self, entry, block, exact):
+        if entry is None or (exact and entry.dirty):
+            return False
+        return block - entry.block <= self.ttl_blocks
+
+    def _fetch(self, chain_id, address, w3, block):
+        wei = w3.eth.get_balance(address, block)
+        with self.lock:
+            self.entries[(chain_id, address.lower())] = BalanceEntry(wei, block)
+        return wei
+
+    def get(self, chain_id, address, w3, exact=False):
+        # exact=True - затронутые нашими транзакциями записи сверяются с сетью (итоговый отчёт)
+        block = self.current_block(chain_id, w3)
+        with self.lock:
+            entry = self.entries.get((chain_id, address.lower()))
+            if self._is_fresh(entry, block, exact):
+                return entry.wei
+        return self._fetch(chain_id, address, w3, block)
+
+    def apply_tx(self, chain_id, sender, to, value, gas_cost):
+        # локальная оценка после отправки: отправитель платит value + газ, получатель получает value
+        with self.lock:
+            entry = self.entries.get((chain_id, sender.lower()))
+            if entry is not None:
+                entry.wei = max(entry.wei - value - gas_cost, 0)
+                entry.dirty = True
+            entry = self.entries.get((chain_id, to.lower()))
+            if entry is not None:
+                entry.wei += value
+                entry.dirty = True
+
+    def invalidate(self, chain_id, address):
+        with self.lock:
+            entry = self.entries.get((chain_id, address.lower()))
+            if entry is not None:
+                entry.dirty = True
@@ -0,0 +1,77 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+from rpc_client import FastRPC, orjson
+
+########################################
+# Микробенчмарк: вызовов/с на ядро для горячих методов, web3 против FastRPC.
+# Мок RPC запускается отдельным процессом, чтобы не делить с клиентом GIL;
+# "на ядро" = вызовы / процессорное время клиента.
+########################################
+CHAIN_ID = 10
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(port):
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_rpc.py"), "--port", str(port), "--balance", "1000"],
+                               stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("мок RPC не запустился")
+
+
+def measure(label, func, calls):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for i in range(calls):
+        func(i)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    print(f"{label:<45} {calls / wall:>9.0f} вызовов/с   {calls / cpu if cpu else 0:>9.0f} вызовов/с на ядро")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк горячих RPC вызовов: web3 против FastRPC")
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    port = free_port()
+    mock = start_mock(port)
+    try:
+        url = f"http://127.0.0.1:{port}/{CHAIN_ID}"
+        w3 = Web3(Web3.HTTPProvider(url))
+        rpc = FastRPC(url)
+        account = Account.create()
+        signed = [
+            Account.sign_transaction({"nonce": nonce, "to": account.address, "value": 1, "gas": 21000,
+                                      "gasPrice": 10 ** 9, "chainId": CHAIN_ID}, account.key).raw_transaction
+            for nonce in range(2 * args.calls)
+        ]
+        print(f"orjson: {'да' if orjson is not None else 'нет'}, вызовов на метод: {args.calls}")
+        measure("web3   eth_gasPrice", lambda i: w3.eth.gas_price, args.calls)
+        measure("FastRPC eth_gasPrice", lambda i: rpc.gas_price(), args.calls)
+        measure("web3   eth_getTransactionCount", lambda i: w3.eth.get_transaction_count(account.address, "pending"), args.calls)
+        measure("FastRPC eth_getTransactionCount", lambda i: rpc.get_transaction_count(account.address, "pending"), args.calls)
+        measure("web3   eth_sendRawTransaction", lambda i: w3.eth.send_raw_transaction(signed[i]), args.calls)
+        measure("FastRPC eth_sendRawTransaction", lambda i: rpc.send_raw_transaction(signed[args.calls + i]), args.calls)
+    finally:
+        mock.terminate()
+
+
+if __name__ == "__main__":
+    main()
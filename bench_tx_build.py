@@ -0,0 +1,62 @@
+import argparse
+import time
+
+from eth_account import Account
+
+from tx_templates import TransferTemplate
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+########################################
+# Микробенчмарк: сборок подписанных транзакций в секунду,
+# Account.sign_transaction с обычным словарём против шаблона TransferTemplate.
+########################################
+CHAIN_ID = 10
+VALUE_WEI = 1
+GAS_PRICE = 10 ** 9
+
+
+def measure(label, func, count):
+    started = time.perf_counter()
+    for nonce in range(count):
+        func(nonce)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {count / elapsed:>9.0f} tx/s")
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сборки транзакций: sign_transaction против шаблона")
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    account = Account.create()
+    recipient = Account.create().address
+    template = TransferTemplate(account.key, CHAIN_ID, VALUE_WEI)
+
+    def plain(nonce):
+        tx = {
+            'nonce': nonce,
+            'to': recipient,
+            'value': VALUE_WEI,
+            'gas': 21000,
+            'gasPrice': GAS_PRICE,
+            'chainId': CHAIN_ID
+        }
+        return Account.sign_transaction(tx, account.key)
+
+    for nonce in range(10):
+        assert bytes(plain(nonce).raw_transaction) == template.sign(nonce, GAS_PRICE, recipient).raw_transaction
+
+    print(f"coincurve: {'да' if coincurve is not None else 'нет'}, шаблон: {'быстрый' if template.fast else 'eth_account'}, "
+          f"транзакций: {args.count}")
+    slow = measure("Account.sign_transaction (dict)", plain, args.count)
+    fast = measure("TransferTemplate.sign", lambda nonce: template.sign(nonce, GAS_PRICE, recipient), args.count)
+    print(f"ускорение: x{fast / slow:.1f}")
+
+
+if __name__ == "__main__":
+    main()
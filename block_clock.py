@@ -0,0 +1,225 @@
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+from web3.datastructures import AttributeDict
+
+from chain_cache import get_chain_cache
+from rpc_client import FastRPC, RPCError
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Часы блоков: одна подписка newHeads (WebSocket) или один поллер eth_blockNumber на сеть.
+# На каждый новый блок ровно один раз обновляются gasPrice и кэш nonce
+# и одним батчем проверяются ожидаемые чеки транзакций.
+########################################
+POLL_INTERVAL = 2.0       # период опроса eth_blockNumber без WebSocket, секунд
+WS_RECONNECTS = 3         # попыток переподключения WebSocket до перехода на опрос
+RECEIPT_BATCH = 50        # чеков в одном батче, пока лимит эндпоинта неизвестен
+RECEIPT_INT_FIELDS = ("blockNumber", "cumulativeGasUsed", "gasUsed", "effectiveGasPrice", "status",
+                      "transactionIndex", "type")
+
+
+def _format_receipt(raw):
+    receipt = dict(raw)
+    for field in RECEIPT_INT_FIELDS:
+        if isinstance(receipt.get(field), str):
+            receipt[field] = int(receipt[field], 16)
+    return AttributeDict(receipt)
+
+
+class PendingReceipt:
+    __slots__ = ("event", "receipt")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.receipt = None
+
+
+class BlockClock:
+    def __init__(self, rpc, ws=None, proxy_manager=None, poll_interval=POLL_INTERVAL):
+        self.rpc = FastRPC(rpc, proxy_manager)
+        self.ws = ws
+        self.poll_interval = poll_interval
+        self.block_number = None
+        self.fetches = {}  # ("gas_price",) / ("nonce", address) -> (номер блока, Future значения)
+        self.pending = {}  # tx_hash -> PendingReceipt
+        self.listeners = []
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def add_listener(self, callback):
+        # callback(block_number) вызывается один раз на каждый новый блок
+        self.listeners.append(callback)
+
+    def _run(self):
+        if self.ws and ws_connect is not None:
+            for attempt in range(WS_RECONNECTS):
+                try:
+                    self._run_ws()
+                except Exception as e:
+                    logger.warning(f"newHeads {self.ws}: {e}, переподключение ({attempt + 1}/{WS_RECONNECTS})")
+                if self.stop_event.is_set():
+                    return
+            logger.warning(f"newHeads {self.ws} недоступен, переход на опрос eth_blockNumber")
+            get_chain_cache().set_feature(self.rpc.endpoint, "ws", False)
+        self._run_poll()
+
+    def _run_ws(self):
+        with ws_connect(self.ws) as connection:
+            connection.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            reply = json.loads(connection.recv(timeout=10))
+            if "error" in reply:
+                raise RPCError(reply["error"].get("code"), reply["error"].get("message"))
+            get_chain_cache().set_feature(self.rpc.endpoint, "ws", True)
+            while not self.stop_event.is_set():
+                try:
+                    message = json.loads(connection.recv(timeout=self.poll_interval * 5))
+                except TimeoutError:
+                    continue
+                head = message.get("params", {}).get("result")
+                if head and "number" in head:
+                    self._on_block(int(head["number"], 16))
+
+    def _run_poll(self):
+        while not self.stop_event.is_set():
+            try:
+                number = int(self.rpc.call("eth_blockNumber"), 16)
+                if number != self.block_number:
+                    self._on_block(number)
+            except Exception as e:
+                logger.warning(f"eth_blockNumber {self.rpc.endpoint}: {e}")
+            time.sleep(self.poll_interval)
+
+    def _on_block(self, number):
+        with self.condition:
+            self.block_number = number
+            self.fetches = {}
+            pending = list(self.pending.items())
+        if pending:
+            self._check_receipts(pending)
+        for callback in self.listeners:
+            try:
+                callback(number)
+            except Exception as e:
+                logger.warning(f"Обработчик блока {number}: {e}")
+        with self.condition:
+            self.condition.notify_all()
+
+    def _check_receipts(self, pending):
+        # чеки запрашиваются батчами не больше лимита эндпоинта (из кэша возможностей)
+        limit = get_chain_cache().feature(self.rpc.endpoint, "batch_limit") or RECEIPT_BATCH
+        for start in range(0, len(pending), limit):
+            if not self._check_receipt_chunk(pending[start:start + limit]):
+                return
+
+    def _check_receipt_chunk(self, chunk):
+        try:
+            results = self.rpc.batch([("eth_getTransactionReceipt", [tx_hash]) for tx_hash, _ in chunk])
+        except Exception as e:
+            logger.warning(f"Проверка чеков {self.rpc.endpoint}: {e}")
+            return False
+        if len(chunk) > 1 and all(isinstance(result, RPCError) for result in results):
+            # батч отклонён целиком - вероятно, превышен лимит; уменьшаем, остальное проверится на следующем блоке
+            limit = max(len(chunk) // 2, 1)
+            logger.warning(f"Проверка чеков {self.rpc.endpoint}: батч из {len(chunk)} отклонён, лимит {limit}")
+            get_chain_cache().set_feature(self.rpc.endpoint, "batch_limit", limit)
+            return False
+        for (tx_hash, waiter), result in zip(chunk, results):
+            if result and not isinstance(result, RPCError):
+                waiter.receipt = _format_receipt(result)
+                with self.condition:
+                    self.pending.pop(tx_hash, None)
+                waiter.event.set()
+        return True
+
+    def _once_per_block(self, key, fetch):
+        # один запрос на блок: первый вызвавший поток запрашивает, остальные ждут его результат.
+        # Значение привязано к блоку, для которого запрошено: ответ, пришедший после нового блока,
+        # в новый блок не попадёт
+        with self.condition:
+            block = self.block_number
+            entry = self.fetches.get(key)
+            owner = entry is None or entry[0] != block
+            if owner:
+                entry = self.fetches[key] = (block, concurrent.futures.Future())
+        future = entry[1]
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+                with self.condition:  # ошибка не кэшируется: следующий вызов повторит запрос
+                    if self.fetches.get(key) is entry:
+                        del self.fetches[key]
+        return future.result()
+
+    def gas_price(self):
+        return self._once_per_block(("gas_price",), self.rpc.gas_price)
+
+    def nonce(self, address):
+        # pending nonce, не чаще одного запроса за блок
+        return self._once_per_block(("nonce", address), lambda: self.rpc.get_transaction_count(address, "pending"))
+
+    def wait_for_block(self, timeout=None):
+        with self.condition:
+            start = self.block_number
+            self.condition.wait_for(lambda: self.block_number != start or self.stop_event.is_set(), timeout)
+            return self.block_number
+
+    def wait_for_receipt(self, tx_hash, timeout=120):
+        tx_hash = tx_hash if isinstance(tx_hash, str) else "0x" + bytes(tx_hash).hex()
+        with self.condition:
+            waiter = self.pending.setdefault(tx_hash, PendingReceipt())
+        if not waiter.event.wait(timeout):
+            with self.condition:
+                self.pending.pop(tx_hash, None)
+            raise TimeoutError(f"Чек транзакции {tx_hash} не получен за {timeout} с")
+        return waiter.receipt
+
+    def find_receipt(self, tx_hashes):
+        # чек любой из версий транзакции (повтор с другой ценой газа меняет хэш); -> (хэш, чек) или (None, None)
+        hashes = [h if isinstance(h, str) else "0x" + bytes(h).hex() for h in tx_hashes]
+        if not hashes:
+            return None, None
+        try:
+            results = self.rpc.batch([("eth_getTransactionReceipt", [h]) for h in hashes])
+        except Exception as e:
+            logger.warning(f"Проверка чеков {len(hashes)} транзакций не удалась: {e}")
+            return None, None
+        for tx_hash, result in zip(hashes, results):
+            if result and not isinstance(result, RPCError):
+                return tx_hash, _format_receipt(result)
+        return None, None
+
+
+BLOCK_CLOCKS = {}
+BLOCK_CLOCKS_LOCK = threading.Lock()
+
+
+def get_block_clock(config, proxy_manager=None):
+    # одни часы на RPC: config["ws"] (необязательно) - WebSocket эндпоинт для newHeads
+    with BLOCK_CLOCKS_LOCK:
+        clock = BLOCK_CLOCKS.get(config["rpc"])
+        if clock is None:
+            # WebSocket, не работавший в прошлых запусках, не ждём - сразу опрос
+            ws = config.get("ws") if get_chain_cache().feature(config["rpc"], "ws") is not False else None
+            clock = BLOCK_CLOCKS[config["rpc"]] = BlockClock(config["rpc"], ws, proxy_manager).start()
+        return clock
@@ -1,11 +1,17 @@
+import argparse
 import logging
+import sys
 import os
+import threading
 import time
-import random
-import requests
 import concurrent.futures
 from web3 import Web3
 from eth_account import Account
+from proxy_manager import ProxiedHTTPProvider, ProxyManager, load_proxies
+from block_clock import get_block_clock
+from chain_cache import get_chain_cache, warm_up
+from result_store import ResultStore, TxResult
+import simulate
 
 
 ########################################
@@ -37,27 +43,10 @@ logger = logging.getLogger()
 ########################################
 # 2. Загрузка прокси из файла proxies.txt (если есть)
 ########################################
-def load_proxies(filename="proxies.txt"):
-    proxies = []
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split(":")
-                if len(parts) == 4:
-                    host, port, username, password = parts
-                    proxy_url = f"http://{username}:{password}@{host}:{port}"
-                else:
-                    proxy_url = line
-                proxies.append(proxy_url)
-    return proxies
-
-
-PROXIES = load_proxies()
-if PROXIES:
-    logger.info(f"Прокси используются: найдено {len(PROXIES)} прокси.")
+STICKY_PROXIES = False  # закреплять прокси за кошельком (весь трафик кошелька через один прокси)
+PROXY_MANAGER = ProxyManager(load_proxies(), sticky=STICKY_PROXIES)
+if PROXY_MANAGER:
+    logger.info(f"Прокси используются: найдено {len(PROXY_MANAGER)} прокси.")
 else:
     logger.info("Прокси не используются.")
 
@@ -71,10 +60,8 @@ def get_web3(rpc):
     if rpc in WEB3_CACHE:
         return WEB3_CACHE[rpc]
     else:
-        if PROXIES:
-            proxy = random.choice(PROXIES)
-            logger.debug(f"Используется прокси для Web3: {proxy}")
-            provider = Web3.HTTPProvider(rpc, request_kwargs={"proxies": {"http": proxy, "https": proxy}})
+        if PROXY_MANAGER:
+            provider = ProxiedHTTPProvider(rpc, PROXY_MANAGER)
         else:
             provider = Web3.HTTPProvider(rpc)
         w3_obj = Web3(provider)
@@ -174,14 +161,11 @@ def get_li_fi_quote(private_key, from_chain, to_chain, from_amount, proxies={}):
         "fromAddress": checksum_address
     }
     headers = {"Content-Type": "application/json"}
-    if not proxies and PROXIES:
-        chosen_proxy = random.choice(PROXIES)
-        proxies = {'http': chosen_proxy, 'https': chosen_proxy}
-        logger.info(f"(LI.Fi) Используется прокси для запроса котировки: {chosen_proxy}")
     try:
         logger.info(
             f"LI.Fi: Запрос котировки: fromChain={from_chain_id}, toChain={to_chain_id}, fromAmount={from_amount}, fromAddress={checksum_address}")
-        r = requests.get(LI_FI_QUOTE_URL, params=params, headers=headers, proxies=proxies, timeout=30)
+        # без прокси кошелька запрос идёт через менеджер прокси (выбор быстрого, повтор через другой при сбое)
+        r = PROXY_MANAGER.request("GET", LI_FI_QUOTE_URL, params=params, headers=headers, proxies=proxies, timeout=30)
         if r.status_code == 200:
             data = r.json()
             logger.info(f"LI.Fi: Получена котировка для toChain {to_chain_id}")
@@ -205,7 +189,7 @@ def get_li_fi_quote(private_key, from_chain, to_chain, from_amount, proxies={}):
 ########################################
 # 8. Функция отправки транзакции по данным котировки
 ########################################
-def send_quote_transaction(quote_data, private_key, w3):
+def send_quote_transaction(quote_data, private_key, w3, clock=None):
     if "transactionRequest" not in quote_data:
         logger.error("В котировке отсутствует 'transactionRequest'")
         return None
@@ -235,7 +219,10 @@ def send_quote_transaction(quote_data, private_key, w3):
         signed_tx = w3.eth.account.sign_transaction(tx, private_key)
         tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
         logger.info(f"Транзакция отправлена: {w3.to_hex(tx_hash)}")
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
+        if clock is not None:  # чек проверяется раз в блок общим для сети поллером/подпиской
+            receipt = clock.wait_for_receipt(tx_hash, timeout=300)
+        else:
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
         logger.info(f"Транзакция подтверждена, статус: {receipt.status}")
         return tx_hash
     except Exception as e:
@@ -266,14 +253,19 @@ def get_wallet_balances(wallets, networks):
 ########################################
 # 10. Функция обработки одного кошелька (многопоточность)
 ########################################
-def process_wallet(wallet_data, from_chain, to_chain_input, amount_wei):
+def process_wallet(wallet_data, from_chain, to_chain_input, amount_wei, store):
     address, priv, proxy = wallet_data
-    results = {}
+
+    def record(target, status, tx_hash=None):
+        store.add(TxResult(address, from_chain, target, status, ok=bool(tx_hash), tx_count=1 if tx_hash else 0,
+                           tx_hash=Web3.to_hex(tx_hash) if tx_hash else ""))
+
     proxies = {'http': proxy, 'https': proxy} if proxy else {}
     try:
         logger.info(f"Начинаю мост для кошелька {address} из {from_chain}")
         # Получаем локальный объект Web3 для from_chain
         w3_local = get_web3(chain_info[from_chain]["rpc"])
+        clock = get_block_clock(chain_info[from_chain], PROXY_MANAGER if PROXY_MANAGER else None)
         if to_chain_input == "all":
             for target in chain_info.keys():
                 if target == from_chain:
@@ -281,7 +273,7 @@ def process_wallet(wallet_data, from_chain, to_chain_input, amount_wei):
                 logger.info(f"Мост из {from_chain} в {target} для {address}")
                 quote = get_li_fi_quote(priv, from_chain, target, amount_wei, proxies=proxies)
                 if quote is None:
-                    results[f"{address}->{target}"] = "Quote Error"
+                    record(target, "Quote Error")
                 else:
                     # Проверяем баланс: вычисляем требуемую сумму
                     try:
@@ -294,20 +286,20 @@ def process_wallet(wallet_data, from_chain, to_chain_input, amount_wei):
                         if current_balance < required:
                             logger.error(
                                 f"Кошелек {address} имеет недостаточно средств. Баланс: {current_balance}, требуется: {required}")
-                            results[f"{address}->{target}"] = "FAILED (Insufficient funds)"
+                            record(target, "FAILED (Insufficient funds)")
                             continue
                     except Exception as e:
                         logger.error(f"Ошибка расчёта необходимых средств для {address} -> {target}: {e}")
-                        results[f"{address}->{target}"] = "FAILED (Calc error)"
+                        record(target, "FAILED (Calc error)")
                         continue
 
-                    tx_hash = send_quote_transaction(quote, priv, w3_local)
-                    results[f"{address}->{target}"] = "Tx Successful" if tx_hash else "Tx Error"
+                    tx_hash = send_quote_transaction(quote, priv, w3_local, clock)
+                    record(target, "Tx Successful" if tx_hash else "Tx Error", tx_hash)
         else:
             logger.info(f"Мост из {from_chain} в {to_chain_input} для {address}")
             quote = get_li_fi_quote(priv, from_chain, to_chain_input, amount_wei, proxies=proxies)
             if quote is None:
-                results[address] = "Quote Error"
+                record(to_chain_input, "Quote Error")
             else:
                 try:
                     tx_req = quote["transactionRequest"]
@@ -319,32 +311,60 @@ def process_wallet(wallet_data, from_chain, to_chain_input, amount_wei):
                     if current_balance < required:
                         logger.error(
                             f"Кошелек {address} имеет недостаточно средств. Баланс: {current_balance}, требуется: {required}")
-                        results[address] = "FAILED (Insufficient funds)"
-                        return results
+                        record(to_chain_input, "FAILED (Insufficient funds)")
+                        return
                 except Exception as e:
                     logger.error(f"Ошибка расчёта необходимых средств для {address}: {e}")
-                    results[address] = "FAILED (Calc error)"
-                    return results
+                    record(to_chain_input, "FAILED (Calc error)")
+                    return
 
-                tx_hash = send_quote_transaction(quote, priv, w3_local)
-                results[address] = "Tx Successful" if tx_hash else "Tx Error"
+                tx_hash = send_quote_transaction(quote, priv, w3_local, clock)
+                record(to_chain_input, "Tx Successful" if tx_hash else "Tx Error", tx_hash)
     except Exception as err:
         logger.error(f"Ошибка для {address}: {err}")
-        results[address] = "Error"
-    return results
+        record(to_chain_input, "Error")
 
 
 ########################################
 # 11. Основная функция main()
 ########################################
+def parse_args():
+    parser = argparse.ArgumentParser(description="Мост ETH между OP Stack сетями через Li.Fi")
+    parser.add_argument("--report", help="файл для потоковой записи результатов (.csv или .jsonl)")
+    simulate.add_arguments(parser)
+    return parser.parse_args()
+
+
 def main():
+    global LI_FI_QUOTE_URL
+    args = parse_args()
+    simulation = None
+    if args.simulate:
+        simulation = simulate.Simulation(args, sys.modules[__name__])
+        chain_info.update(simulation.networks(chain_info))
+        LI_FI_QUOTE_URL = simulation.quote_url
+        PROXY_MANAGER.clear()
+        WEB3_CACHE.clear()
+        logger.info(f"Режим симуляции: RPC и Li.Fi заменены заглушкой {simulation.server.url}")
+
     available_chains = list(chain_info.keys())
+    if PROXY_MANAGER:
+        PROXY_MANAGER.probe_url = chain_info[available_chains[0]]["rpc"]
+        # свежая история прокси из прошлых запусков - стартовая проверка идёт в фоне
+        if get_chain_cache().seed_proxies(PROXY_MANAGER):
+            threading.Thread(target=PROXY_MANAGER.probe_all, daemon=True).start()
+        else:
+            PROXY_MANAGER.probe_all()
+        PROXY_MANAGER.start_background()
     logger.info("Доступные блокчейны: " + ", ".join(available_chains))
 
     from_chain = input("Введите блокчейн отправления: ").strip().lower()
     if from_chain not in chain_info:
         logger.error("Блокчейн отправления недоступен!")
         return
+    # chain id сети отправления - из кэша прошлых запусков или проверкой eth_chainId
+    if from_chain not in warm_up({from_chain: chain_info[from_chain]}):
+        return
 
     to_chain_input = input("Введите блокчейн назначения (или 'all' для всех остальных): ").strip().lower()
     if to_chain_input != "all" and to_chain_input not in chain_info:
@@ -362,33 +382,33 @@ def main():
     if not wallets:
         logger.error("Файл wallets.txt пуст!")
         return
+    if simulation:
+        wallets = [(addr, priv, "") for addr, priv, _ in wallets]
 
-    results = {}
+    # результаты пишутся потоками прямо в хранилище (и в файл отчёта, если задан --report)
+    store = ResultStore(args.report)
     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
         future_map = {
-            executor.submit(process_wallet, wallet, from_chain, to_chain_input, amount_wei): wallet
+            executor.submit(PROXY_MANAGER.call_sticky, wallet[0], process_wallet, wallet, from_chain, to_chain_input, amount_wei, store): wallet
             for wallet in wallets
         }
         for future in concurrent.futures.as_completed(future_map):
-            partial_res = future.result()
-            results.update(partial_res)
+            future.result()
+    store.close()
+    if PROXY_MANAGER:
+        get_chain_cache().save_proxies(PROXY_MANAGER)
+    get_chain_cache().save()
 
     balances = get_wallet_balances(wallets, chain_info)
 
     logger.info("\n=== Итоговый отчёт ===")
-    wallet_index_map = {wallets[i][0]: i + 1 for i in range(len(wallets))}
-    addresses_in_order = [w[0] for w in wallets]
-    for addr in addresses_in_order:
-        relevant_keys = [k for k in results if k.startswith(addr)]
-        statuses = [results[rk] for rk in relevant_keys]
-        if statuses and any(s == "Tx Successful" for s in statuses):
-            overall = "SUCCESS"
-        else:
-            overall = "FAILED"
-        idx = wallet_index_map.get(addr, "?")
+    for idx, (addr, _, _) in enumerate(wallets, start=1):
+        overall = "SUCCESS" if store.summary(addr).successes else "FAILED"
         bal_str = balances.get(addr, "Нет данных о балансе")
         logger.info(f"Wallet {idx} ({addr}): {overall}")
         logger.info(f"  Balances: {bal_str}")
+    if simulation:
+        simulation.report(logger.info)
 
     input("\nPress Enter to exit...")
 
@@ -0,0 +1,286 @@
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from rpc_client import FastRPC, RPCError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: слияние без блокировки файла
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Кэш метаданных сетей между запусками (в пользовательском каталоге кэша):
+# проверенный chain id, лимит батча и поддержка WebSocket,
+# история задержек эндпоинтов и прокси, nonce кошельков по вошедшим в блоки транзакциям.
+# Запуск стартует с кэша; устаревшие записи перепроверяются по мере надобности,
+# несовпадение chain id всегда проверяется по сети до отправки.
+########################################
+CACHE_VERSION = 1
+CACHE_FILE = "chain_cache.json"
+CHAIN_ID_TTL = 7 * 24 * 3600      # chain id эндпоинта перепроверяется раз в неделю
+FEATURES_TTL = 24 * 3600          # возможности эндпоинта - раз в сутки (устаревшие обновляются в фоне)
+PROXY_HISTORY_TTL = 6 * 3600      # история прокси свежее этого - стартовая проверка уходит в фон
+EWMA_ALPHA = 0.3
+SLOW_ENDPOINT = 1.0               # средняя задержка эндпоинта, после которой выводится предупреждение, секунд
+PROBE_BATCH = 50                  # размер пробного батча (совпадает с размером батча отправки)
+
+
+def default_cache_dir():
+    override = os.environ.get("OPSTACK_CACHE_DIR")
+    if override:
+        return override
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "opstack")
+
+
+class ChainIdMismatch(Exception):
+    pass
+
+
+class ChainCache:
+    def __init__(self, path=None):
+        # path=None - кэш только в памяти (симуляция)
+        self.path = path
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.data = self._load()
+
+    @staticmethod
+    def _empty():
+        return {"version": CACHE_VERSION, "endpoints": {}, "proxies": {}, "nonces": {}}
+
+    def _load(self):
+        if not self.path:
+            return self._empty()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self._empty()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш сетей {self.path} не прочитан ({e}), старт с пустого кэша")
+            return self._empty()
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return self._empty()
+        return data
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        # чтение, слияние и замена файла - под одной блокировкой, иначе параллельный процесс
+        # может прочитать файл до нашей замены и затереть наши записи своими
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        # запись слиянием с файлом на диске: процессы и узлы бота не затирают nonce друг друга
+        if not self.path:
+            return
+        with self.lock:
+            snapshot = json.loads(json.dumps(self.data))
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._file_lock():
+                merged = self._load()
+                for section in ("endpoints", "proxies"):
+                    for key, entry in snapshot[section].items():
+                        merged[section].setdefault(key, {}).update(entry)
+                for key, nonce in snapshot["nonces"].items():
+                    merged["nonces"][key] = max(nonce, merged["nonces"].get(key, 0))
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(merged, f, indent=1)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Кэш сетей {self.path} не сохранён: {e}")
+
+    def _endpoint(self, rpc_url):
+        return self.data["endpoints"].setdefault(rpc_url, {})
+
+    def record_latency(self, rpc_url, latency):
+        with self.lock:
+            entry = self._endpoint(rpc_url)
+            previous = entry.get("latency")
+            entry["latency"] = latency if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * latency
+
+    def endpoint_latency(self, rpc_url):
+        with self.lock:
+            return self.data["endpoints"].get(rpc_url, {}).get("latency")
+
+    def _timed_call(self, rpc, method, params=()):
+        started = time.monotonic()
+        result = rpc.call(method, params)
+        self.record_latency(rpc.endpoint, time.monotonic() - started)
+        return result
+
+    ########################################
+    # chain id
+    ########################################
+    def verify_chain_id(self, config, rpc=None):
+        # -> True, если chain id подтверждён из кэша (без запроса к сети)
+        expected = config["chain_id"]
+        with self.lock:
+            entry = dict(self.data["endpoints"].get(config["rpc"], {}))
+        if entry.get("chain_id") == expected and time.time() - entry.get("chain_id_checked", 0) < CHAIN_ID_TTL:
+            return True
+        rpc = rpc or FastRPC(config["rpc"])
+        actual = int(self._timed_call(rpc, "eth_chainId"), 16)
+        with self.lock:
+            endpoint = self._endpoint(config["rpc"])
+            endpoint["chain_id"] = actual
+            endpoint["chain_id_checked"] = time.time()
+        if actual != expected:
+            raise ChainIdMismatch(f"{config['rpc']}: eth_chainId = {actual}, а в настройках указан {expected}")
+        return False
+
+    ########################################
+    # возможности эндпоинта
+    ########################################
+    def features(self, rpc_url, rpc=None):
+        # свежие - из кэша; устаревшие отдаются сразу и обновляются в фоне; отсутствующие - проверяются сейчас
+        with self.lock:
+            features = dict(self.data["endpoints"].get(rpc_url, {}).get("features", {}))
+        if not features.get("checked"):
+            return self._probe_features(rpc_url, rpc)
+        if time.time() - features["checked"] >= FEATURES_TTL:
+            with self.lock:
+                refresh = rpc_url not in self.refreshing
+                self.refreshing.add(rpc_url)
+            if refresh:
+                threading.Thread(target=self._probe_features, args=(rpc_url, rpc), daemon=True).start()
+        return features
+
+    def _probe_features(self, rpc_url, rpc=None):
+        rpc = rpc or FastRPC(rpc_url)
+        features = {}
+        try:
+            results = rpc.batch([("eth_chainId", [])] * PROBE_BATCH)
+            answered = sum(not isinstance(result, RPCError) for result in results)
+            features["batch_limit"] = PROBE_BATCH if answered == PROBE_BATCH else max(answered, 1)
+        except Exception as e:
+            # эндпоинт недоступен - ничего не запоминаем, проверка повторится при следующем обращении
+            logger.warning(f"{rpc_url}: проверка возможностей не удалась: {e}")
+            with self.lock:
+                self.refreshing.discard(rpc_url)
+                return dict(self.data["endpoints"].get(rpc_url, {}).get("features", {}))
+        features["ws"] = None  # WebSocket проверяется часами блоков при подключении; раз в сутки - новая попытка
+        features["checked"] = time.time()
+        with self.lock:
+            entry = self._endpoint(rpc_url).setdefault("features", {})
+            entry.update(features)
+            self.refreshing.discard(rpc_url)
+            return dict(entry)
+
+    def feature(self, rpc_url, name):
+        # только из кэша, без запросов к сети; None - неизвестно
+        with self.lock:
+            return self.data["endpoints"].get(rpc_url, {}).get("features", {}).get(name)
+
+    def set_feature(self, rpc_url, name, value):
+        with self.lock:
+            self._endpoint(rpc_url).setdefault("features", {})[name] = value
+
+    ########################################
+    # прокси
+    ########################################
+    def seed_proxies(self, manager):
+        # -> True, если у всех прокси есть свежая история и стартовую проверку можно не ждать
+        with self.lock:
+            history = {proxy: entry for proxy, entry in self.data["proxies"].items() if proxy in manager.stats}
+        manager.seed_stats(history)
+        now = time.time()
+        return bool(manager) and all(now - history.get(proxy, {}).get("updated", 0) < PROXY_HISTORY_TTL
+                                     for proxy in manager.proxies)
+
+    def save_proxies(self, manager):
+        now = time.time()
+        with self.lock:
+            for proxy, stats in manager.export_stats().items():
+                self.data["proxies"][proxy] = dict(stats, updated=now)
+
+    ########################################
+    # nonce
+    ########################################
+    def nonce(self, chain_id, address):
+        # nonce по 'latest' из прошлых запусков - нижняя граница: в сети nonce только растёт
+        with self.lock:
+            return self.data["nonces"].get(f"{chain_id}:{address.lower()}", 0)
+
+    def set_nonce(self, chain_id, address, nonce):
+        key = f"{chain_id}:{address.lower()}"
+        with self.lock:
+            self.data["nonces"][key] = max(nonce, self.data["nonces"].get(key, 0))
+
+
+CHAIN_CACHE = None
+CHAIN_CACHE_LOCK = threading.Lock()
+
+
+def get_chain_cache():
+    global CHAIN_CACHE
+    with CHAIN_CACHE_LOCK:
+        if CHAIN_CACHE is None:
+            CHAIN_CACHE = ChainCache(os.path.join(default_cache_dir(), CACHE_FILE))
+        return CHAIN_CACHE
+
+
+def use_memory_cache():
+    # заглушки и форки не должны попадать в кэш на диске
+    global CHAIN_CACHE
+    with CHAIN_CACHE_LOCK:
+        CHAIN_CACHE = ChainCache()
+
+
+def warm_up(networks, log=logger.info):
+    # проверка chain id и возможностей выбранных сетей параллельно; -> сети, прошедшие проверку
+    cache = get_chain_cache()
+
+    def check(item):
+        name, config = item
+        try:
+            cached = cache.verify_chain_id(config)
+            cache.features(config["rpc"])
+        except ChainIdMismatch as e:
+            return name, e
+        except Exception as e:
+            logger.warning(f"{name}: проверка эндпоинта не удалась ({e}), продолжаем без неё")
+            return name, None
+        latency = cache.endpoint_latency(config["rpc"])
+        if latency is not None and latency > SLOW_ENDPOINT:
+            logger.warning(f"{name}: эндпоинт {config['rpc']} медленный по прошлым запускам ({latency:.2f} с)")
+        return name, "cached" if cached else None
+
+    if not networks:
+        return networks
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(networks))) as executor:
+        results = dict(executor.map(check, networks.items()))
+    verified = {}
+    for name, config in networks.items():
+        result = results[name]
+        if isinstance(result, ChainIdMismatch):
+            logger.error(f"{name}: {result}. Сеть исключена.")
+            continue
+        verified[name] = config
+    from_cache = sum(result == "cached" for result in results.values())
+    log(f"Кэш сетей: chain id подтверждён из кэша для {from_cache} из {len(networks)} сетей")
+    cache.save()
+    return verified
@@ -1,11 +1,22 @@
+import argparse
 import logging
+import sys
 import os
+import threading
 import time
-import random
 import requests
 import concurrent.futures
 from web3 import Web3
 from eth_account import Account
+from proxy_manager import ProxiedHTTPProvider, ProxyManager, load_proxies
+from balance_cache import BalanceCache
+from rpc_client import FastRPC
+from block_clock import get_block_clock
+from tx_submitter import get_submitter
+from tx_templates import get_template
+from chain_cache import get_chain_cache, warm_up
+from send_state import GAS_BUMP, REPRICE, RESYNC, TERMINAL, SendState
+import simulate
 
 
 class ColoredFormatter(logging.Formatter):
@@ -31,26 +42,10 @@ logger = logging.getLogger()
 ########################################
 # 2. Загрузка прокси из файла proxies.txt
 ########################################
-def load_proxies(filename="proxies.txt"):
-    proxies = []
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split(":")
-                if len(parts) == 4:
-                    host, port, username, password = parts
-                    proxy_url = f"http://{username}:{password}@{host}:{port}"
-                else:
-                    proxy_url = line
-                proxies.append(proxy_url)
-    return proxies
-
-PROXIES = load_proxies()
-if PROXIES:
-    logger.info(f"Прокси используются: найдено {len(PROXIES)} прокси.")
+STICKY_PROXIES = False  # закреплять прокси за кошельком (весь трафик кошелька через один прокси)
+PROXY_MANAGER = ProxyManager(load_proxies(), sticky=STICKY_PROXIES)
+if PROXY_MANAGER:
+    logger.info(f"Прокси используются: найдено {len(PROXY_MANAGER)} прокси.")
 else:
     logger.info("Прокси не используются.")
 
@@ -58,20 +53,26 @@ else:
 # 3. Создание и кэширование с прокси
 ########################################
 WEB3_CACHE = {}
+FAST_RPC_CACHE = {}
+BALANCE_CACHE = BalanceCache()
 def get_web3(rpc):
     if rpc in WEB3_CACHE:
         return WEB3_CACHE[rpc]
     else:
-        if PROXIES:
-            proxy = random.choice(PROXIES)
-            logger.info(f"Используется прокси для Web3: {proxy}")
-            provider = Web3.HTTPProvider(rpc, request_kwargs={"proxies": {"http": proxy, "https": proxy}})
+        if PROXY_MANAGER:
+            provider = ProxiedHTTPProvider(rpc, PROXY_MANAGER)
         else:
             provider = Web3.HTTPProvider(rpc)
         w3_obj = Web3(provider)
         WEB3_CACHE[rpc] = w3_obj
         return w3_obj
 
+# горячие вызовы (nonce, gasPrice, отправка) идут через лёгкий клиент в обход middleware web3
+def get_fast_rpc(rpc):
+    if rpc not in FAST_RPC_CACHE:
+        FAST_RPC_CACHE[rpc] = FastRPC(rpc, PROXY_MANAGER if PROXY_MANAGER else None)
+    return FAST_RPC_CACHE[rpc]
+
 ########################################
 # 4. Конфигурация блокчейнов
 ########################################
@@ -114,10 +115,12 @@ SEND_AMOUNT_ETH = 0.0005   # Сумма, отправляемая каждому
 THRESHOLD_ETH = 0.00001   # Если баланс получателя выше – рассылка не производится
 GAS_LIMIT = 21000
 DELAY_BETWEEN_TX = 0.15
+DISPERSE_BATCH = 20         # транзакций рассылки в одном JSON-RPC батче
 
 # Для сбора (Collect)
 FIXED_GAS_PRICE = 1000000000  # 1 Gwei
 COLLECT_PERCENTAGE = 0.95     # Собрать 95% средств (после вычета газа)
+COLLECT_WORKERS = 10          # доноров, обрабатываемых одновременно
 
 ########################################
 # 6. Загрузка кошельков (wallets.txt)
@@ -138,49 +141,126 @@ def load_wallets(filename="wallets.txt"):
 ########################################
 # 7. Функция рассылки для одной сети (Disperse)
 ########################################
+MINED = "mined"      # наша транзакция с этим nonce в блоке
+PENDING = "pending"  # nonce ещё не в блоке - наша транзакция может ждать в мемпуле
+TAKEN = "taken"      # nonce в блоке, но не нашей транзакцией
+
+def resolve_nonce(clock, rpc, address, nonce, tx_hashes):
+    # что стало с nonce, под которым подписаны tx_hashes: -> (статус, хэш, чек)
+    for attempt in range(2):
+        tx_hash, receipt = clock.find_receipt(tx_hashes)
+        if receipt is not None:
+            return MINED, tx_hash, receipt
+        try:
+            mined_nonce = rpc.get_transaction_count(address, 'latest')
+        except Exception as e:
+            logger.warning(f"nonce {address} не получен ({e}), повтор под прежним nonce")
+            return PENDING, None, None
+        if nonce >= mined_nonce:
+            return PENDING, None, None
+        if attempt == 0:
+            clock.wait_for_block(timeout=30)  # чек мог ещё не дойти до этого узла RPC
+    return TAKEN, None, None
+
 def disperse_for_network(sender, recipients, config):
     w3 = get_web3(config["rpc"])
+    rpc = get_fast_rpc(config["rpc"])
+    clock = get_block_clock(config, PROXY_MANAGER if PROXY_MANAGER else None)
     chain_id = config["chain_id"]
     sender_address, sender_key = sender
     sender_address = Web3.to_checksum_address(sender_address)
-    sender_nonce = w3.eth.get_transaction_count(sender_address, 'pending')
-    logger.info(f"[Disperse][{chain_id}]: Отправитель {sender_address} – nonce: {sender_nonce}")
+    next_nonce = rpc.get_transaction_count(sender_address, 'pending')
+    logger.info(f"[Disperse][{chain_id}]: Отправитель {sender_address} – nonce: {next_nonce}")
     success_count = 0
 
-    for idx, recipient in enumerate(recipients, start=1):
+    eligible = []
+    for recipient in recipients:
         rec_address, _ = recipient
         rec_address = Web3.to_checksum_address(rec_address)
-        balance = w3.eth.get_balance(rec_address)
+        balance = BALANCE_CACHE.get(chain_id, rec_address, w3)
         balance_eth = float(w3.from_wei(balance, "ether"))
         if balance_eth > THRESHOLD_ETH:
             logger.info(f"[Disperse][{chain_id}]: Получатель {rec_address} имеет баланс {balance_eth:.6f} ETH, пропуск.")
             continue
+        eligible.append(rec_address)
 
-        tx = {
-            'nonce': sender_nonce,
-            'to': rec_address,
-            'value': Web3.to_wei(SEND_AMOUNT_ETH, "ether"),
-            'gas': GAS_LIMIT,
-            'gasPrice': w3.eth.gas_price,
-            'chainId': chain_id
-        }
-        retries = 3
-        while retries > 0:
+    # транзакции с последовательными nonce подписываются пачкой и уходят одним батчем;
+    # при ошибке пачка повторяется с первой неудачной, уже принятые узлом дают "already known".
+    # Nonce закрепляется за получателем при первой подписи: повторы идут под тем же nonce,
+    # поэтому транзакция, ответ на которую потерялся, не может оплатить получателя дважды
+    submitter = get_submitter(config["rpc"], PROXY_MANAGER if PROXY_MANAGER else None)
+    value = Web3.to_wei(SEND_AMOUNT_ETH, "ether")
+    template = get_template(chain_id, sender_key, value, GAS_LIMIT)
+    gas_price = clock.gas_price()
+    state = SendState(config["rpc"])
+    nonces = {}  # позиция получателя -> закреплённый nonce
+    signed_hashes = {}  # позиция получателя -> [(хэш, gasPrice)] всех подписанных под этим nonce версий
+    position = 0
+    while position < len(eligible):
+        state.before_send()
+        chunk_start = position
+        futures = []
+        for index in range(position, min(position + DISPERSE_BATCH, len(eligible))):
+            if index not in nonces:
+                nonces[index] = next_nonce
+                next_nonce += 1
+            signed_tx = template.sign(nonces[index], gas_price, eligible[index])
+            signed_hashes.setdefault(index, []).append(("0x" + bytes(signed_tx.hash).hex(), gas_price))
+            futures.append((eligible[index], submitter.submit(signed_tx.raw_transaction, signed_tx.hash)))
+        error = None
+        for rec_address, future in futures:
             try:
-                signed_tx = w3.eth.account.sign_transaction(tx, sender_key)
-                tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                logger.info(f"[Disperse][{chain_id}]: TX {Web3.to_hex(tx_hash)} отправлена на {rec_address} ({idx}/{len(recipients)})")
-                success_count += 1
-                sender_nonce += 1
-                break
+                tx_hash = future.result(60)
             except Exception as e:
-                logger.warning(f"[Disperse][{chain_id}]: Ошибка отправки с {sender_address} на {rec_address}: {str(e)}. Повтор через 3 сек...")
-                time.sleep(3)
-                retries -= 1
-        if retries == 0:
-            logger.error(f"[Disperse][{chain_id}]: Не удалось отправить TX на {rec_address} после нескольких попыток.")
-        time.sleep(DELAY_BETWEEN_TX)
-    final_nonce = w3.eth.get_transaction_count(sender_address, 'pending')
+                error = e
+                break
+            position += 1
+            success_count += 1
+            logger.info(f"[Disperse][{chain_id}]: TX {tx_hash} отправлена на {rec_address} ({position}/{len(eligible)})")
+            BALANCE_CACHE.apply_tx(chain_id, sender_address, rec_address, value, GAS_LIMIT * gas_price)
+        if error is None:
+            state.on_success()
+            gas_price = clock.gas_price()
+            time.sleep(DELAY_BETWEEN_TX)
+            continue
+        if position > chunk_start:
+            state.on_success()
+        action = state.on_error(error)
+        if action == TERMINAL:
+            logger.error(f"[Disperse][{chain_id}]: Рассылка с {sender_address} остановлена на {eligible[position]}: {state.reason}")
+            break
+        if action == RESYNC:
+            # nonce в блоке: получатели, чьи транзакции уже прошли, пропускаются; ожидающие в мемпуле
+            # повторяются под своим nonce. Новый nonce - только если закреплённый занят не нашей
+            # успешной транзакцией, и только за пределами уже подписанных
+            next_nonce = max(next_nonce, clock.nonce(sender_address))
+            while position in nonces:
+                status, tx_hash, receipt = resolve_nonce(clock, rpc, sender_address, nonces[position],
+                                                         [h for h, _ in signed_hashes[position]])
+                if status == PENDING:
+                    break
+                if status == MINED and receipt.status == 1:
+                    success_count += 1
+                    landed_price = dict(signed_hashes[position])[tx_hash]
+                    BALANCE_CACHE.apply_tx(chain_id, sender_address, eligible[position], value, GAS_LIMIT * landed_price)
+                    logger.info(f"[Disperse][{chain_id}]: TX {tx_hash} на {eligible[position]} уже в блоке ({position + 1}/{len(eligible)})")
+                    position += 1
+                    continue
+                # nonce израсходован неудачной или чужой транзакцией - получатель не оплачен
+                logger.warning(f"[Disperse][{chain_id}]: nonce {nonces[position]} для {eligible[position]} занят, "
+                               f"новый nonce {next_nonce} ({sender_address}).")
+                nonces[position] = next_nonce
+                signed_hashes[position] = []
+                next_nonce += 1
+                break
+            continue
+        if action == REPRICE:
+            gas_price = int(gas_price * GAS_BUMP)
+            logger.info(f"[Disperse][{chain_id}]: Повышение gasPrice до {gas_price} для {sender_address} (nonce {nonces[position]}).")
+        delay = state.backoff()
+        logger.warning(f"[Disperse][{chain_id}]: Ошибка отправки с {sender_address} на {eligible[position]}: {str(error)}. Повтор через {delay} сек...")
+        time.sleep(delay)
+    final_nonce = rpc.get_transaction_count(sender_address, 'pending')
     logger.info(f"[Disperse][{chain_id}]: Завершено: отправлено {success_count} TX (nonce: {final_nonce}).")
     return success_count
 
@@ -201,22 +281,25 @@ def disperse_all_networks(sender, recipients, selected_networks):
 ########################################
 def collect_for_network(main_wallet, donor_wallets, config, gas_limit=GAS_LIMIT, fixed_gas_price=FIXED_GAS_PRICE, percentage=COLLECT_PERCENTAGE):
     w3 = get_web3(config["rpc"])
+    rpc = get_fast_rpc(config["rpc"])
+    clock = get_block_clock(config, PROXY_MANAGER if PROXY_MANAGER else None)
     chain_id = config["chain_id"]
     main_address = Web3.to_checksum_address(main_wallet[0])
+    submitter = get_submitter(config["rpc"], PROXY_MANAGER if PROXY_MANAGER else None)
     collected_txs = []
-    for donor in donor_wallets:
+    def collect_from(donor):
         donor_address, donor_key = donor
         donor_address = Web3.to_checksum_address(donor_address)
-        balance = w3.eth.get_balance(donor_address)
+        balance = BALANCE_CACHE.get(chain_id, donor_address, w3)
         gas_cost = gas_limit * fixed_gas_price
         if balance <= gas_cost:
             logger.info(f"[Collect][{chain_id}]: Кошелек {donor_address} не может оплатить газ (баланс: {balance}).")
-            continue
+            return
         amount_to_send = int(percentage * (balance - gas_cost))
         if amount_to_send <= 0:
             logger.info(f"[Collect][{chain_id}]: Кошелек {donor_address} не имеет средств для перевода после вычета газа.")
-            continue
-        nonce = w3.eth.get_transaction_count(donor_address, 'pending')
+            return
+        nonce = rpc.get_transaction_count(donor_address, 'pending')
         current_gas_price = fixed_gas_price
         tx = {
             'nonce': nonce,
@@ -226,39 +309,67 @@ def collect_for_network(main_wallet, donor_wallets, config, gas_limit=GAS_LIMIT,
             'gasPrice': current_gas_price,
             'chainId': chain_id
         }
-        retries = 3
+        state = SendState(config["rpc"])
         sent = False
-        while retries > 0:
+        sent_hashes = []  # (хэш, gasPrice) всех подписанных версий транзакции
+        while True:
             try:
                 tx['nonce'] = nonce
                 tx['gasPrice'] = current_gas_price
                 signed_tx = w3.eth.account.sign_transaction(tx, donor_key)
-                tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                logger.info(f"[Collect][{chain_id}]: TX {Web3.to_hex(tx_hash)} отправлена с {donor_address} на {main_address}. Ожидание подтверждения (10 сек)...")
-                receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=10)
+                sent_hashes.append(("0x" + bytes(signed_tx.hash).hex(), current_gas_price))
+                state.before_send()
+                tx_hash = submitter.send(signed_tx.raw_transaction, signed_tx.hash)
+                logger.info(f"[Collect][{chain_id}]: TX {tx_hash} отправлена с {donor_address} на {main_address}. Ожидание подтверждения (10 сек)...")
+                receipt = clock.wait_for_receipt(tx_hash, timeout=10)
                 if receipt and receipt.status == 1:
-                    logger.info(f"[Collect][{chain_id}]: TX {Web3.to_hex(tx_hash)} подтверждена.")
+                    logger.info(f"[Collect][{chain_id}]: TX {tx_hash} подтверждена.")
+                    state.on_success()
+                    BALANCE_CACHE.apply_tx(chain_id, donor_address, main_address, amount_to_send, receipt.gasUsed * current_gas_price)
                     collected_txs.append(tx_hash)
                     sent = True
                     break
                 else:
                     raise Exception("TX не подтверждена")
             except Exception as e:
-                logger.warning(f"[Collect][{chain_id}]: Ошибка отправки TX с {donor_address} (nonce {nonce}): {str(e)}. Повтор через 3 сек...")
-                time.sleep(3)
-                retries -= 1
-                if retries > 0:
-                    if "nonce too low" in str(e).lower():
-                        new_nonce = w3.eth.get_transaction_count(donor_address, 'pending')
-                        logger.warning(f"[Collect][{chain_id}]: Обновление nonce с {nonce} до {new_nonce} для {donor_address}.")
-                        nonce = new_nonce
-                    else:
-                        current_gas_price = int(current_gas_price * 1.2)
-                        logger.info(f"[Collect][{chain_id}]: Повышение gasPrice до {current_gas_price} для {donor_address} (nonce {nonce}).")
-                        tx['gasPrice'] = current_gas_price
+                # газ повышается только на ошибки цены; таймаут чека повторяет ту же транзакцию
+                action = state.on_error(e)
+                if action == TERMINAL:
+                    logger.error(f"[Collect][{chain_id}]: Сбор с {donor_address} остановлен (nonce {nonce}): {state.reason}")
+                    break
+                if action == RESYNC:
+                    # nonce в блоке: если нашей транзакцией (чек не дождались) - сбор уже выполнен;
+                    # наша версия ещё в мемпуле - повтор под тем же nonce, новый nonce - только если прежний занят
+                    status, tx_hash, receipt = resolve_nonce(clock, rpc, donor_address, nonce, [h for h, _ in sent_hashes])
+                    if status == MINED and receipt.status == 1:
+                        landed_price = dict(sent_hashes)[tx_hash]
+                        logger.info(f"[Collect][{chain_id}]: TX {tx_hash} с {donor_address} уже в блоке.")
+                        state.on_success()
+                        BALANCE_CACHE.apply_tx(chain_id, donor_address, main_address, amount_to_send, receipt.gasUsed * landed_price)
+                        collected_txs.append(tx_hash)
+                        sent = True
+                        break
+                    if status == PENDING:
+                        clock.wait_for_block(timeout=30)
+                        continue
+                    new_nonce = max(nonce + 1, clock.nonce(donor_address))
+                    logger.warning(f"[Collect][{chain_id}]: nonce {nonce} занят, обновление до {new_nonce} для {donor_address}.")
+                    nonce = new_nonce
+                    sent_hashes = []
+                    continue
+                if action == REPRICE:
+                    current_gas_price = int(current_gas_price * GAS_BUMP)
+                    logger.info(f"[Collect][{chain_id}]: Повышение gasPrice до {current_gas_price} для {donor_address} (nonce {nonce}).")
+                delay = state.backoff()
+                logger.warning(f"[Collect][{chain_id}]: Ошибка отправки TX с {donor_address} (nonce {nonce}): {str(e)}. Повтор через {delay} сек...")
+                time.sleep(delay)
         if not sent:
-            logger.error(f"[Collect][{chain_id}]: Не удалось отправить TX с {donor_address} (nonce {nonce}) после нескольких попыток.")
+            logger.error(f"[Collect][{chain_id}]: Не удалось отправить TX с {donor_address} (nonce {nonce}).")
         time.sleep(DELAY_BETWEEN_TX)
+
+    # доноры обрабатываются параллельно, чтобы их транзакции уходили общими батчами
+    with concurrent.futures.ThreadPoolExecutor(max_workers=COLLECT_WORKERS) as executor:
+        list(executor.map(collect_from, donor_wallets))
     logger.info(f"[Collect][{chain_id}]: Завершено. Собрано {len(collected_txs)} TX.")
     return len(collected_txs)
 
@@ -277,15 +388,16 @@ def collect_all_networks(main_wallet, donor_wallets, selected_networks):
 ########################################
 # 11. Функции для получения балансов
 ########################################
-def get_wallet_balances(wallets, networks):
+def get_wallet_balances(wallets, networks, exact=False):
     net_instances = {net: get_web3(cfg["rpc"]) for net, cfg in networks.items()}
+    chain_ids = {net: cfg["chain_id"] for net, cfg in networks.items()}
     balances = {}
     for addr, _ in wallets:
         checksum = Web3.to_checksum_address(addr)
         balance_list = {}
         for net, w3_obj in net_instances.items():
             try:
-                bal = w3_obj.eth.get_balance(checksum)
+                bal = BALANCE_CACHE.get(chain_ids[net], checksum, w3_obj, exact)
                 bal_eth = float(w3_obj.from_wei(bal, "ether"))
             except Exception:
                 bal_eth = 0
@@ -293,8 +405,8 @@ def get_wallet_balances(wallets, networks):
         balances[addr] = balance_list
     return balances
 
-def check_balances(wallets, networks):
-    balances = get_wallet_balances(wallets, networks)
+def check_balances(wallets, networks, exact=False):
+    balances = get_wallet_balances(wallets, networks, exact)
     for idx, (addr, _) in enumerate(wallets, start=1):
         bal_dict = balances.get(addr, {})
         bal_str = ", ".join(f"{net}: {bal:.6f} ETH" for net, bal in bal_dict.items())
@@ -303,7 +415,31 @@ def check_balances(wallets, networks):
 ########################################
 # 12. Главное меню
 ########################################
+def parse_args():
+    parser = argparse.ArgumentParser(description="Рассылка (Disperse) и сбор (Collect) ETH")
+    simulate.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    simulation = None
+    if args.simulate:
+        simulation = simulate.Simulation(args, sys.modules[__name__])
+        chain_info.update(simulation.networks(chain_info))
+        PROXY_MANAGER.clear()
+        WEB3_CACHE.clear()
+        FAST_RPC_CACHE.clear()
+        logger.info(f"Режим симуляции: RPC заменены заглушкой {simulation.server.url}")
+
+    if PROXY_MANAGER:
+        PROXY_MANAGER.probe_url = next(iter(chain_info.values()))["rpc"]
+        # свежая история прокси из прошлых запусков - стартовая проверка идёт в фоне
+        if get_chain_cache().seed_proxies(PROXY_MANAGER):
+            threading.Thread(target=PROXY_MANAGER.probe_all, daemon=True).start()
+        else:
+            PROXY_MANAGER.probe_all()
+        PROXY_MANAGER.start_background()
+
     logger.info("Выберите режим работы:")
     logger.info("1 - Disperse: рассылка ETH от первого кошелька к остальным по выбранным сетям")
     logger.info("2 - Collect: сбор ETH с доноров к первому кошельку по выбранным сетям")
@@ -324,6 +460,17 @@ def main():
             exit(1)
         selected_networks = [selected_network]
 
+    # chain id и возможности эндпоинтов - из кэша прошлых запусков, сети с чужим chain id исключаются
+    checked = warm_up({net: chain_info[net] for net in selected_networks})
+    selected_networks = [net for net in selected_networks if net in checked]
+    if not selected_networks:
+        logger.error("Нет сетей, прошедших проверку chain id.")
+        exit(1)
+
+    # предварительная проверка балансов заполняет кэш: дальше проверки получателей/доноров идут из памяти
+    if mode in ("1", "2"):
+        check_balances(wallets, {net: chain_info[net] for net in selected_networks})
+
     if mode == "1":
         sender = wallets[0]
         recipients = wallets[1:]
@@ -345,6 +492,16 @@ def main():
         logger.error("Неверный режим. Завершение работы.")
         exit(1)
 
+    if PROXY_MANAGER:
+        get_chain_cache().save_proxies(PROXY_MANAGER)
+    get_chain_cache().save()
+
+    # итоговые балансы: из сети перечитываются только затронутые и устаревшие записи
+    logger.info("\n=== Балансы после операции ===")
+    check_balances(wallets, {net: chain_info[net] for net in selected_networks}, exact=True)
+    if simulation:
+        simulation.report(logger.info)
+
     input("\nНажмите Enter для выхода...")
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+try:
+    from websockets.sync.server import serve as ws_serve
+except ImportError:
+    ws_serve = None
+
+import rlp
+from eth_account import Account
+from eth_utils import keccak, to_checksum_address
+
+########################################
+# Локальный мок JSON-RPC для тестов и прогонов без реальных средств.
+# Каждый путь вида /<chain_id> — отдельная цепочка со своим состоянием:
+#   http://127.0.0.1:8545/10, http://127.0.0.1:8545/8453, ...
+########################################
+DEFAULT_GAS_PRICE = 1000000000  # 1 Gwei
+DEFAULT_BALANCE_WEI = 10 ** 18  # баланс, который получает любой новый адрес
+MOCK_BRIDGE_ADDRESS = "0x000000000000000000000000000000000000b71d"
+
+
+def decode_raw_tx(raw, base_fee):
+    # (sender, nonce, effective gasPrice, gas, to, value) для legacy и EIP-1559 транзакций
+    sender = Account.recover_transaction(raw).lower()
+    if raw[0] == 0x02:
+        fields = rlp.decode(raw[1:])
+        nonce, gas, to, value = fields[1], fields[4], fields[5], fields[6]
+        price = min(int.from_bytes(fields[3], "big"), base_fee + int.from_bytes(fields[2], "big"))
+    else:
+        fields = rlp.decode(raw)
+        nonce, price, gas, to, value = fields[0], fields[1], fields[2], fields[3], fields[4]
+        price = int.from_bytes(price, "big")
+    to = "0x" + to.hex() if to else None
+    return sender, int.from_bytes(nonce, "big"), price, int.from_bytes(gas, "big"), to, int.from_bytes(value, "big")
+
+
+class MockChain:
+    def __init__(self, chain_id, default_balance=DEFAULT_BALANCE_WEI, gas_price=DEFAULT_GAS_PRICE):
+        self.chain_id = chain_id
+        self.default_balance = default_balance
+        self.gas_price = gas_price
+        self.block_number = 1
+        self.balances = {}
+        self.nonces = {}
+        self.receipts = {}
+        self.tx_count = 0
+        self.gas_used = 0
+        self.fees_paid = 0
+        self.value_sent = 0
+        self.lock = threading.Lock()
+
+    def _balance(self, addr):
+        return self.balances.setdefault(addr.lower(), self.default_balance)
+
+    def get_balance(self, addr):
+        with self.lock:
+            return self._balance(addr)
+
+    def get_nonce(self, addr):
+        with self.lock:
+            return self.nonces.get(addr.lower(), 0)
+
+    def send_raw(self, raw):
+        tx_hash = keccak(raw)
+        sender, nonce, price, gas, to, value = decode_raw_tx(raw, self.gas_price)
+        with self.lock:
+            if "0x" + tx_hash.hex() in self.receipts:
+                raise MockRPCError("already known")
+            expected = self.nonces.get(sender, 0)
+            if nonce < expected:
+                raise MockRPCError("nonce too low")
+            if nonce > expected:
+                raise MockRPCError(f"nonce too high: expected {expected}, got {nonce}")
+            if price < self.gas_price:
+                raise MockRPCError("transaction underpriced")
+            gas_used = min(gas, 21000)
+            cost = value + gas_used * price
+            if self._balance(sender) < value + gas * price:
+                raise MockRPCError("insufficient funds for gas * price + value")
+            self.balances[sender] -= cost
+            if to:
+                self.balances[to.lower()] = self._balance(to) + value
+            self.nonces[sender] = nonce + 1
+            self.tx_count += 1
+            self.gas_used += gas_used
+            self.fees_paid += gas_used * price
+            self.value_sent += value
+            self.block_number += 1
+            self.receipts["0x" + tx_hash.hex()] = {
+                "transactionHash": "0x" + tx_hash.hex(),
+                "transactionIndex": "0x0",
+                "blockHash": "0x" + keccak(self.block_number.to_bytes(32, "big")).hex(),
+                "blockNumber": hex(self.block_number),
+                "from": to_checksum_address(sender),
+                "to": to_checksum_address(to) if to else None,
+                "cumulativeGasUsed": hex(gas_used),
+                "gasUsed": hex(gas_used),
+                "effectiveGasPrice": hex(price),
+                "contractAddress": None,
+                "logs": [],
+                "logsBloom": "0x" + "00" * 256,
+                "status": "0x1",
+                "type": "0x2" if raw[0] == 0x02 else "0x0",
+            }
+        return "0x" + tx_hash.hex()
+
+    def handle(self, method, params):
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_gasPrice":
+            return hex(self.gas_price)
+        if method == "eth_maxPriorityFeePerGas":
+            return hex(0)
+        if method == "eth_getBalance":
+            return hex(self.get_balance(params[0]))
+        if method == "eth_getTransactionCount":
+            return hex(self.get_nonce(params[0]))
+        if method == "eth_sendRawTransaction":
+            return self.send_raw(bytes.fromhex(params[0][2:]))
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0])
+        if method == "eth_estimateGas":
+            return hex(21000)
+        if method in ("eth_getCode", "eth_call"):
+            return "0x"
+        if method == "eth_getBlockByNumber":
+            return {
+                "number": hex(self.block_number),
+                "hash": "0x" + keccak(self.block_number.to_bytes(32, "big")).hex(),
+                "parentHash": "0x" + keccak((self.block_number - 1).to_bytes(32, "big")).hex(),
+                "timestamp": hex(int(time.time())),
+                "baseFeePerGas": hex(self.gas_price),
+                "gasLimit": hex(30000000),
+                "gasUsed": "0x0",
+                "transactions": [],
+            }
+        raise MockRPCError(f"the method {method} does not exist/is not available", code=-32601)
+
+
+class MockRPCError(Exception):
+    def __init__(self, message, code=-32000):
+        super().__init__(message)
+        self.code = code
+
+
+class MockRPCServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, default_balance=DEFAULT_BALANCE_WEI, latency=0.0, time_scale=1.0):
+        super().__init__(address, MockRPCHandler)
+        self.default_balance = default_balance
+        # задержка ответа, секунд: число или профиль {chain_id|"default": {method|"default": сек}}
+        self.latency = latency
+        self.time_scale = time_scale  # множитель реальных задержек (симуляция в ускоренном времени)
+        self.gas_prices = {}  # chain_id -> gasPrice для новых цепочек
+        self.forks = {}  # chain_id -> URL локального форка (anvil/hardhat), запросы проксируются туда
+        self.chains = {}
+        self.calls = {}  # (путь, метод) -> [кол-во вызовов, суммарная задержка по профилю]
+        self.cpu_time = 0.0  # процессорное время потоков заглушки (симуляция вычитает его из времени скрипта)
+        self.lock = threading.Lock()
+
+    def latency_for(self, path, method):
+        if not isinstance(self.latency, dict):
+            return self.latency
+        key = path.strip("/").split("/")[0]
+        profile = self.latency.get(key, self.latency.get("default", {}))
+        if not isinstance(profile, dict):
+            return profile
+        return profile.get(method, profile.get("default", 0.0))
+
+    def add_cpu_time(self, seconds):
+        with self.lock:
+            self.cpu_time += seconds
+
+    def record_call(self, path, method, latency):
+        with self.lock:
+            stats = self.calls.setdefault((path.strip("/"), method), [0, 0.0])
+            stats[0] += 1
+            stats[1] += latency
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def chain(self, path):
+        segment = path.strip("/").split("/")[0]
+        chain_id = int(segment) if segment.isdigit() else 1
+        with self.lock:
+            if chain_id not in self.chains:
+                self.chains[chain_id] = MockChain(
+                    chain_id, self.default_balance, self.gas_prices.get(chain_id, DEFAULT_GAS_PRICE))
+            return self.chains[chain_id]
+
+    def dispatch(self, chain, request):
+        method = request.get("method")
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            response["result"] = chain.handle(method, request.get("params") or [])
+        except MockRPCError as e:
+            response["error"] = {"code": e.code, "message": str(e)}
+        except Exception as e:
+            response["error"] = {"code": -32603, "message": str(e)}
+        return response
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def start_block_producer(self, block_time):
+        # пустые блоки раз в block_time секунд, как у настоящей сети
+        def produce():
+            while True:
+                time.sleep(block_time)
+                with self.lock:
+                    chains = list(self.chains.values())
+                for chain in chains:
+                    with chain.lock:
+                        chain.block_number += 1
+        threading.Thread(target=produce, daemon=True).start()
+
+    def start_ws(self, host, port):
+        # WebSocket заглушка: eth_subscribe newHeads и обычные методы по пути /<chain_id>
+        if ws_serve is None:
+            raise RuntimeError("для WebSocket заглушки нужен пакет websockets")
+
+        def handler(connection):
+            chain = self.chain(connection.request.path)
+            subscription = None
+            last_block = chain.block_number
+            while True:
+                try:
+                    message = connection.recv(timeout=0.05)
+                except TimeoutError:
+                    message = None
+                if message is not None:
+                    request = json.loads(message)
+                    if request.get("method") == "eth_subscribe":
+                        subscription = hex(id(connection))
+                        connection.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": subscription}))
+                    else:
+                        connection.send(json.dumps(self.dispatch(chain, request)))
+                if subscription and chain.block_number != last_block:
+                    last_block = chain.block_number
+                    head = chain.handle("eth_getBlockByNumber", ["latest", False])
+                    connection.send(json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                                "params": {"subscription": subscription, "result": head}}))
+
+        ws_server = ws_serve(handler, host, port)
+        threading.Thread(target=ws_server.serve_forever, daemon=True).start()
+        return ws_server
+
+
+class MockRPCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # keep-alive: без TCP_NODELAY Nagle + delayed ACK добавляют ~40 мс к каждому ответу
+    disable_nagle_algorithm = True
+
+    def handle_one_request(self):
+        # разбор JSON, декодирование RLP и восстановление отправителя - процессорное время заглушки, а не скрипта
+        started = time.thread_time()
+        try:
+            super().handle_one_request()
+        finally:
+            self.server.add_cpu_time(time.thread_time() - started)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        items = payload if isinstance(payload, list) else [payload]
+        latency = max((self.server.latency_for(self.path, item.get("method")) for item in items), default=0.0)
+        for item in items:
+            self.server.record_call(self.path, item.get("method"), latency / len(items))
+        if latency:
+            time.sleep(latency * self.server.time_scale)
+        chain = self.server.chain(self.path)
+        if chain.chain_id in self.server.forks:
+            result = self.forward(self.server.forks[chain.chain_id], payload)
+            responses = result if isinstance(result, list) else [result]
+            for item, response in zip(items, responses):
+                if item.get("method") == "eth_sendRawTransaction" and "error" not in response:
+                    self.record_fork_tx(chain, bytes.fromhex(item["params"][0][2:]))
+        elif isinstance(payload, list):
+            result = [self.server.dispatch(chain, item) for item in payload]
+        else:
+            result = self.server.dispatch(chain, payload)
+        self.send_json(result)
+
+    def forward(self, fork_url, payload):
+        request = Request(fork_url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def record_fork_tx(self, chain, raw):
+        # у форка нет нашей бухгалтерии: учитываем газ по лимиту транзакции (оценка сверху)
+        _, _, price, gas, _, value = decode_raw_tx(raw, chain.gas_price)
+        with chain.lock:
+            chain.tx_count += 1
+            chain.gas_used += gas
+            chain.fees_paid += gas * price
+            chain.value_sent += value
+
+    def do_GET(self):
+        # заглушка Li.Fi /v1/quote: перевод нативного ETH на адрес-заглушку моста
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/v1/quote":
+            self.send_json({"message": "not found"}, status=404)
+            return
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        latency = self.server.latency_for("lifi", "quote")
+        self.server.record_call("lifi", "quote", latency)
+        if latency:
+            time.sleep(latency * self.server.time_scale)
+        chain = self.server.chain(f"/{params.get('fromChain', '1')}")
+        self.send_json({
+            "transactionRequest": {
+                "to": MOCK_BRIDGE_ADDRESS,
+                "data": "0x",
+                "value": hex(int(params.get("fromAmount", "0"))),
+                "gasLimit": hex(21000),
+                "gasPrice": hex(chain.gas_price),
+                "chainId": chain.chain_id,
+            }
+        })
+
+    def send_json(self, result, status=200):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный мок JSON-RPC (цепочка выбирается путём /<chain_id>)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--balance", type=float, default=1.0, help="стартовый баланс каждого адреса, ETH")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    parser.add_argument("--block-time", type=float, default=0.0, help="выпускать пустые блоки раз в N секунд")
+    parser.add_argument("--ws-port", type=int, help="порт WebSocket заглушки (newHeads)")
+    args = parser.parse_args()
+    server = MockRPCServer((args.host, args.port), int(args.balance * 10 ** 18), args.latency)
+    print(f"Mock RPC запущен на {server.url}/<chain_id>")
+    if args.block_time:
+        server.start_block_producer(args.block_time)
+    if args.ws_port:
+        server.start_ws(args.host, args.ws_port)
+        print(f"WebSocket заглушка на ws://{args.host}:{args.ws_port}/<chain_id>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
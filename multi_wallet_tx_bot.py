@@ -1,6 +1,22 @@
 from web3 import Web3
+from balance_cache import BalanceCache
+from rpc_client import FastRPC
+from block_clock import get_block_clock
+from tx_submitter import get_submitter
+from tx_templates import get_template
+from chain_cache import get_chain_cache, use_memory_cache, warm_up
+from send_state import DONE, GAS_BUMP, REPRICE, RESYNC, TERMINAL, SendState
+from result_store import ResultStore, TxResult
+import simulate
+from multiprocessing.managers import BaseManager
+import multiprocessing
 import concurrent.futures
+import argparse
+import secrets
+import threading
+import queue
 import time
+import sys
 import os
 
 ALL_NETWORKS = {
@@ -16,6 +32,37 @@ ALL_NETWORKS = {
 TX_TARGET = 250 # нужное количество транзакций
 VALUE_WEI = Web3.to_wei(0.00001, "ether") # кол-во отправляемого eth
 DELAY_BETWEEN_TX = 0.25  # задержка между транзакциями, секунд
+ENDPOINT_RATE_LIMIT = 25  # общий лимит запросов в секунду на один RPC, делится между всеми шардами
+RATE_SHARE = 1.0  # доля лимита, выделенная текущему процессу (задаётся в шарде)
+
+class RateLimiter: # token bucket на один RPC эндпоинт
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+BALANCE_CACHE = BalanceCache()
+
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+def get_rate_limiter(rpc):
+    with RATE_LIMITERS_LOCK:
+        if rpc not in RATE_LIMITERS:
+            RATE_LIMITERS[rpc] = RateLimiter(max(ENDPOINT_RATE_LIMIT * RATE_SHARE, 1))
+        return RATE_LIMITERS[rpc]
 
 def load_wallets(filename="wallets.txt"): #загрузка кошельков из текстового файла
     wallets = []
@@ -29,11 +76,23 @@ def load_wallets(filename="wallets.txt"): #загрузка кошельков 
     return wallets
 
 def send_transactions(wallet_name, net_name, config, address, private_key):
-    w3 = Web3(Web3.HTTPProvider(config["rpc"]))
+    rpc = FastRPC(config["rpc"])  # горячие вызовы в обход middleware web3
+    clock = get_block_clock(config)  # gasPrice и nonce обновляются раз в блок, общие для всех кошельков
+    submitter = get_submitter(config["rpc"])  # транзакции всех кошельков сети уходят общими батчами
     chain_id = config["chain_id"]
+    limiter = get_rate_limiter(config["rpc"])
+
+    cache = get_chain_cache()
 
     try:
-        start_nonce = w3.eth.get_transaction_count(address, 'pending')
+        # nonce из прошлых запусков (только вошедшие в блоки транзакции) - нижняя граница:
+        # если цель уже была достигнута, сеть не опрашиваем
+        cached_nonce = cache.nonce(chain_id, address)
+        if cached_nonce >= TX_TARGET:
+            print(f"⚠️ {wallet_name}: {net_name} уже отправлено {cached_nonce} tx (по кэшу), пропуск.")
+            return 0
+        limiter.acquire()
+        start_nonce = rpc.get_transaction_count(address, 'pending')
         if start_nonce >= TX_TARGET:
             print(f"⚠️ {wallet_name}: {net_name} уже отправлено {start_nonce} tx, пропуск.")
             return 0
@@ -44,45 +103,51 @@ def send_transactions(wallet_name, net_name, config, address, private_key):
         tx_sent = 0
         current_nonce = start_nonce
 
+        template = get_template(chain_id, private_key, VALUE_WEI)  # статические поля проверены и закодированы один раз
+        state = SendState(config["rpc"])
+        min_gas_price = 0  # нижняя граница цены после REPRICE для текущего nonce
+
+        # nonce увеличивается только после принятия транзакции узлом - пропусков не бывает
         while current_nonce < target_nonce:
-            gas_price = w3.eth.gas_price
-            tx = {
-                'nonce': current_nonce,
-                'to': address,
-                'value': VALUE_WEI,
-                'gas': 21000,
-                'gasPrice': gas_price,
-                'chainId': chain_id
-            }
-            retries = 3
-            while retries > 0:
-                try:
-                    signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-                    tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-                    print(f"{wallet_name} {net_name} TX {current_nonce+1}/{target_nonce}: {Web3.to_hex(tx_hash)}")
-                    tx_sent += 1
-                    current_nonce += 1  # успешно отправлено – переходим к следующему nonce
-                    break  # выходим из цикла повторов для этого nonce
-                except Exception as e:
-                    error_str = str(e).lower()
-                    if "nonce too low" in error_str:
-                        new_nonce = w3.eth.get_transaction_count(address, 'pending')
-                        print(f"⚠️ {wallet_name} {net_name}: nonce too low, обновление с {current_nonce} до {new_nonce}")
-                        current_nonce = new_nonce
-                        break
-                    elif "insufficient funds" in error_str or "overshot" in error_str:
-                        print(f"⚠️ {wallet_name} {net_name}: недостаточно средств для nonce {current_nonce}. Повтор через 3с...")
-                        time.sleep(3)
-                        retries = 3  # сброс попыток для этого nonce, количество повторений
-                        continue
-                    else:
-                        print(f"⚠️ {wallet_name} {net_name} nonce {current_nonce}: ошибка {str(e)} — повтор через 3с...")
-                        time.sleep(3)
-                        retries -= 1
-            if retries == 0:
-                print(f"❌ {wallet_name} {net_name} nonce {current_nonce}: не удалось отправить tx после нескольких попыток.")
-                current_nonce += 1
+            gas_price = max(clock.gas_price(), min_gas_price)
+            signed_tx = template.sign(current_nonce, gas_price, address)
+            state.before_send()
+            limiter.acquire()
+            try:
+                tx_hash = submitter.send(signed_tx.raw_transaction, signed_tx.hash)
+            except Exception as e:
+                action = state.on_error(e)
+                if action == TERMINAL:
+                    print(f"❌ {wallet_name} {net_name} nonce {current_nonce}: остановка, {state.reason}")
+                    break
+                if action == RESYNC:
+                    limiter.acquire()
+                    new_nonce = clock.nonce(address)
+                    if new_nonce <= current_nonce:  # значение этого блока устарело - ждём следующий
+                        clock.wait_for_block(timeout=30)
+                        new_nonce = clock.nonce(address)
+                    print(f"⚠️ {wallet_name} {net_name}: nonce too low, обновление с {current_nonce} до {new_nonce}")
+                    current_nonce = max(current_nonce, new_nonce)
+                    min_gas_price = 0
+                    continue
+                if action != DONE:
+                    if action == REPRICE:
+                        min_gas_price = int(gas_price * GAS_BUMP)
+                    delay = state.backoff()
+                    print(f"⚠️ {wallet_name} {net_name} nonce {current_nonce}: ошибка {str(e)} — повтор через {delay}с...")
+                    time.sleep(delay)
+                    continue
+                tx_hash = "0x" + bytes(signed_tx.hash).hex()
+            state.on_success()
+            print(f"{wallet_name} {net_name} TX {current_nonce+1}/{target_nonce}: {tx_hash}")
+            BALANCE_CACHE.apply_tx(chain_id, address, address, VALUE_WEI, template.gas * gas_price)
+            tx_sent += 1
+            current_nonce += 1  # успешно отправлено – переходим к следующему nonce
+            min_gas_price = 0
 
+        # в кэш - nonce по 'latest': принятая узлом транзакция ещё может выпасть из мемпула
+        limiter.acquire()
+        cache.set_nonce(chain_id, address, rpc.get_transaction_count(address, 'latest'))
         print(f"✅ {wallet_name} {net_name}: отправлено {tx_sent} tx.\n")
         return tx_sent
     except Exception as e:
@@ -104,7 +169,7 @@ def run_wallet(wallet_index, address, private_key, networks):
                 tx_counts[net_name] = 0
     return wallet_index, tx_counts
 
-def get_balances(wallets, networks): #получаем балансы
+def get_balances(wallets, networks, exact=False): #получаем балансы (из кэша, перечитываются только устаревшие/затронутые)
     net_instances = {
         net_name: Web3(Web3.HTTPProvider(config["rpc"]))
         for net_name, config in networks.items()
@@ -115,7 +180,7 @@ def get_balances(wallets, networks): #получаем балансы
         address_checksum = Web3.to_checksum_address(address)
         for net_name, w3 in net_instances.items():
             try:
-                balance = w3.eth.get_balance(address_checksum)
+                balance = BALANCE_CACHE.get(networks[net_name]["chain_id"], address_checksum, w3, exact)
                 balance_eth = w3.from_wei(balance, "ether")
             except Exception as e:
                 balance_eth = 0
@@ -126,66 +191,271 @@ def get_balances(wallets, networks): #получаем балансы
 # отображение балансов
 def check_balances(wallets, networks):
     print("\nБаланс кошельков:")
-    net_instances = {
-        net_name: Web3(Web3.HTTPProvider(config["rpc"]))
-        for net_name, config in networks.items()
-    }
-    for wallet_index, (address, _) in enumerate(wallets, start=1):
+    balances = get_balances(wallets, networks)
+    for wallet_index in range(1, len(wallets) + 1):
         wallet_name = f"Wallet {wallet_index}"
-        balances_info = []
-        address_checksum = Web3.to_checksum_address(address)
-        for net_name, w3 in net_instances.items():
+        balances_info = [f"{net_name} - {balance_eth:.6f} ETH" for net_name, balance_eth in balances[wallet_index].items()]
+        print(f"{wallet_name}: {', '.join(balances_info)}")
+
+# шардирование: кошельки делятся на непрерывные диапазоны между процессами и хостами
+def shard_wallets(indexed_wallets, shard_index, shard_count):
+    per_shard, extra = divmod(len(indexed_wallets), shard_count)
+    start = shard_index * per_shard + min(shard_index, extra)
+    end = start + per_shard + (1 if shard_index < extra else 0)
+    return indexed_wallets[start:end]
+
+def run_shard(shard_label, indexed_wallets, networks, result_queue, rate_share):
+    global RATE_SHARE
+    RATE_SHARE = rate_share
+    try:
+        if indexed_wallets:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(indexed_wallets)) as wallet_executor:
+                wallet_futures = [
+                    wallet_executor.submit(run_wallet, idx, addr, pk, networks)
+                    for idx, addr, pk in indexed_wallets
+                ]
+                for future in concurrent.futures.as_completed(wallet_futures):
+                    wallet_index, tx_counts = future.result()
+                    result_queue.put(("result", wallet_index, tx_counts))
+    finally:
+        get_chain_cache().save()
+        result_queue.put(("done", shard_label, None))
+
+RESULT_POLL_INTERVAL = 1.0  # как часто проверять, живы ли процессы-шарды, секунд
+DEAD_SHARD_GRACE = 5.0      # сколько ждать "done" от уже завершившегося процесса, секунд
+NODE_HEARTBEAT = 10.0       # как часто узел сообщает координатору, что жив, секунд
+DEFAULT_NODE_TIMEOUT = 120  # узел, молчащий дольше, считается сбойным, секунд
+
+def collect_results(inbox, expected_done, on_result, workers=None, nodes=None, node_timeout=DEFAULT_NODE_TIMEOUT):
+    # workers: {метка шарда: Process}; шард, умерший без "done" (OOM, SIGKILL), считается сбойным.
+    # nodes: {метка удалённого узла: число его кошельков}; узел без "alive"/"done" дольше node_timeout
+    # (упал, потерял сеть) считается сбойным
+    done = 0
+    finished = set()
+    dead_since = {}
+    last_seen = {label: time.monotonic() for label in (nodes or {})}
+    while done < expected_done:
+        try:
+            kind, key, payload = inbox.get(timeout=RESULT_POLL_INTERVAL)
+        except queue.Empty:
+            for label, worker in (workers or {}).items():
+                if label in finished or worker.is_alive():
+                    continue
+                dead_since.setdefault(label, time.monotonic())
+                if time.monotonic() - dead_since[label] >= DEAD_SHARD_GRACE:
+                    finished.add(label)
+                    done += 1
+                    print(f"❌ {label} аварийно завершился (код {worker.exitcode}), его кошельки без результата ({done}/{expected_done})")
+            for label, seen in last_seen.items():
+                if label in finished or time.monotonic() - seen < node_timeout:
+                    continue
+                finished.add(label)
+                done += 1
+                print(f"❌ {label} не отвечает {node_timeout} с, его кошельки ({nodes[label]}) без результата ({done}/{expected_done})")
+            continue
+        if kind == "alive":
+            if key in last_seen:
+                last_seen[key] = time.monotonic()
+        elif kind == "done":
+            if key in finished:
+                continue  # узел уже признан сбойным - повторно не засчитывается
+            finished.add(key)
+            done += 1
+            print(f"✔ {key} завершён ({done}/{expected_done})")
+        else:
+            on_result(key, payload)
+
+class QueueManager(BaseManager):
+    pass
+
+def serve_result_queue(address, authkey, inbox): # очередь результатов, доступная удалённым узлам
+    QueueManager.register("get_queue", callable=lambda: inbox)
+    manager = QueueManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Координатор ожидает узлы на {address[0]}:{address[1]}")
+
+def connect_result_queue(address, authkey):
+    QueueManager.register("get_queue")
+    manager = QueueManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.get_queue()
+
+def run_node(node_label, node_wallets, networks, processes, rate_share, inbox):
+    # запускает локальные процессы-шарды и пересылает их результаты в inbox
+    local_queue = multiprocessing.Queue()
+    workers = {}
+    for shard_index in range(processes):
+        shard = shard_wallets(node_wallets, shard_index, processes)
+        label = f"Шард {shard_index + 1}"
+        worker = multiprocessing.Process(
+            target=run_shard,
+            args=(label, shard, networks, local_queue, rate_share / processes),
+        )
+        worker.start()
+        workers[label] = worker
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        # координатор отличает долгую отправку от упавшего узла
+        while True:
             try:
-                balance = w3.eth.get_balance(address_checksum)
-                balance_eth = w3.from_wei(balance, "ether")
+                inbox.put(("alive", node_label, None))
             except Exception as e:
-                balance_eth = 0
-            balances_info.append(f"{net_name} - {balance_eth:.6f} ETH")
-        print(f"{wallet_name}: {', '.join(balances_info)}")
+                print(f"⚠️ {node_label}: координатор недоступен ({e})")
+            if stop_heartbeat.wait(NODE_HEARTBEAT):
+                return
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        collect_results(local_queue, processes, lambda idx, counts: inbox.put(("result", idx, counts)), workers)
+        for worker in workers.values():
+            worker.join()
+    finally:
+        stop_heartbeat.set()
+        inbox.put(("done", node_label, None))
+
+DEFAULT_LISTEN = "127.0.0.1:50000"  # для других хостов укажите --listen 0.0.0.0:50000 явно
+
+def parse_address(value):
+    host, port = value.rsplit(":", 1)
+    return host, int(port)
+
+def record_wallet_result(store, wallets, wallet_index, tx_counts):
+    address = wallets[wallet_index - 1][0]
+    for net_name, tx_count in tx_counts.items():
+        store.add(TxResult(address, net_name, address, "OK" if tx_count else "NO TX", ok=bool(tx_count), tx_count=tx_count))
+
+def print_report(store, wallets, final_balances, networks):
+    print("\nИтоговый отчет:")
+    for wallet_index, (address, _) in enumerate(wallets, start=1):
+        if address not in store.summaries:
+            continue
+        tx_counts = store.summary(address).tx_counts
+        wallet_name = f"Wallet {wallet_index}"
+        wallet_balances = final_balances.get(wallet_index, {})
+        report_lines = []
+        for net in networks.keys():
+            bal = wallet_balances.get(net, 0)
+            tx_count = tx_counts.get(net, 0)
+            report_lines.append(f"{net}: {bal:.6f} ETH, {tx_count} tx")
+        report_str = "; ".join(report_lines)
+        print(f"{wallet_name}: {report_str}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Массовая отправка транзакций с нескольких кошельков")
+    parser.add_argument("--wallets", default="wallets.txt", help="файл кошельков address:private_key")
+    parser.add_argument("--chains", help="блокчейны через запятую или 'all' (иначе спросит интерактивно)")
+    parser.add_argument("--yes", action="store_true", help="не спрашивать подтверждение")
+    parser.add_argument("--processes", type=int, default=1, help="число локальных процессов-шардов")
+    parser.add_argument("--nodes", type=int, default=1, help="общее число узлов (хостов)")
+    parser.add_argument("--node", type=int, default=0, help="номер этого узла, 0 - координатор")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN,
+                        help=f"host:port, на котором координатор принимает результаты узлов (по умолчанию {DEFAULT_LISTEN})")
+    parser.add_argument("--connect", help="host:port координатора (для узлов 1..N-1)")
+    parser.add_argument("--node-timeout", type=float, default=DEFAULT_NODE_TIMEOUT,
+                        help="через сколько секунд молчания узел считается сбойным (по умолчанию %(default)s)")
+    parser.add_argument("--authkey", default=os.environ.get("OPSTACK_AUTHKEY"),
+                        help="ключ очереди результатов (или OPSTACK_AUTHKEY); координатор без ключа создаёт случайный")
+    parser.add_argument("--mock-rpc", help="URL мок RPC (например http://127.0.0.1:8545) вместо реальных сетей")
+    parser.add_argument("--report", help="файл для потоковой записи результатов (.csv или .jsonl)")
+    simulate.add_arguments(parser)
+    args = parser.parse_args()
+    if args.node_timeout <= NODE_HEARTBEAT:
+        parser.error(f"--node-timeout должен быть больше интервала сигнала узлов ({NODE_HEARTBEAT:.0f} с)")
+    if args.connect and not args.authkey:
+        parser.error("для --connect нужен --authkey (или OPSTACK_AUTHKEY) - ключ, выведенный координатором")
+    return args
 
 if __name__ == "__main__":
-    wallets = load_wallets()
+    args = parse_args()
+    wallets = load_wallets(args.wallets)
 
     print("Доступные блокчейны:", ", ".join(ALL_NETWORKS.keys()))
-    selected_chains = input("Введите блокчейны через запятую (или 'all' для всех): ").strip()
+    selected_chains = args.chains or input("Введите блокчейны через запятую (или 'all' для всех): ").strip()
 
     if selected_chains.lower() == 'all':
         networks = ALL_NETWORKS
     else:
         chosen = [chain.strip().capitalize() for chain in selected_chains.split(",") if chain.strip().capitalize() in ALL_NETWORKS]
         networks = {chain: ALL_NETWORKS[chain] for chain in chosen}
+    if args.mock_rpc:
+        use_memory_cache()
+        networks = {
+            net_name: dict(config, rpc=f"{args.mock_rpc.rstrip('/')}/{config['chain_id']}")
+            for net_name, config in networks.items()
+        }
+    simulation = None
+    if args.simulate:
+        simulation = simulate.Simulation(args, sys.modules[__name__])
+        networks = simulation.networks(networks)
+
+    # chain id и возможности эндпоинтов - из кэша прошлых запусков, сети с чужим chain id исключаются
+    networks = warm_up(networks, print)
+
+    indexed_wallets = [(idx + 1, addr, pk) for idx, (addr, pk) in enumerate(wallets)]
+    node_wallets = shard_wallets(indexed_wallets, args.node, args.nodes)
+    authkey = (args.authkey or "").encode()
+
+    if args.connect: # узел-исполнитель: результаты уходят координатору, отчёт строит координатор
+        inbox = connect_result_queue(parse_address(args.connect), authkey)
+        print(f"Узел {args.node}: кошельки {len(node_wallets)} из {len(wallets)}")
+        run_node(f"Узел {args.node}", node_wallets, networks, args.processes, 1.0 / args.nodes, inbox)
+        raise SystemExit(0)
+
+    inbox = queue.Queue()
+    if args.nodes > 1:
+        # очередь работает через pickle: знающий ключ может выполнить код на координаторе
+        if not authkey:
+            authkey = secrets.token_hex(16).encode()
+            print(f"Ключ для узлов: --authkey {authkey.decode()}")
+        serve_result_queue(parse_address(args.listen), authkey, inbox)
 
     # вывод балансов до отправки транзакций
     check_balances(wallets, networks)
 
-    proceed = input("\nНачать отправку транзакций? (y/n): ")
-    wallet_results = []
+    proceed = "y" if args.yes or simulation else input("\nНачать отправку транзакций? (y/n): ")
+    store = ResultStore(args.report)
     if proceed.lower() == "y":
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(wallets)) as wallet_executor:
-            wallet_futures = [
-                wallet_executor.submit(run_wallet, idx+1, addr, pk, networks)
-                for idx, (addr, pk) in enumerate(wallets)
-            ]
-            for future in concurrent.futures.as_completed(wallet_futures):
-                wallet_results.append(future.result())
+        if args.processes == 1 and args.nodes == 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(wallets)) as wallet_executor:
+                wallet_futures = [
+                    wallet_executor.submit(run_wallet, idx+1, addr, pk, networks)
+                    for idx, (addr, pk) in enumerate(wallets)
+                ]
+                for future in concurrent.futures.as_completed(wallet_futures):
+                    record_wallet_result(store, wallets, *future.result())
+        else:
+            local_node = threading.Thread(
+                target=run_node,
+                args=("Узел 0", node_wallets, networks, args.processes, 1.0 / args.nodes, inbox),
+                daemon=True,
+            )
+            local_node.start()
+            remote_nodes = {f"Узел {node}": len(shard_wallets(indexed_wallets, node, args.nodes))
+                            for node in range(1, args.nodes)}
+            collect_results(inbox, args.nodes, lambda idx, counts: record_wallet_result(store, wallets, idx, counts),
+                            nodes=remote_nodes, node_timeout=args.node_timeout)
     else:
         print("Отправка транзакций отменена пользователем.")
         print("Отправка транзакций отменена пользователем.")
 
-    # получаем актуальные балансы после отправки транзакций
-    final_balances = get_balances(wallets, networks)
+    # кошельки, отправившие транзакции (в том числе в других процессах), сверяются с сетью
+    store.close()
+    for address, _ in wallets:
+        for net_name, tx_count in store.summary(address).tx_counts.items():
+            if tx_count:
+                BALANCE_CACHE.invalidate(networks[net_name]["chain_id"], address)
+
+    get_chain_cache().save()
+
+    # получаем актуальные балансы после отправки транзакций (только дельта)
+    final_balances = get_balances(wallets, networks, exact=True)
 
     # выводим итоговый отчет
-    print("\nИтоговый отчет:")
-    for wallet_index, tx_counts in sorted(wallet_results, key=lambda x: x[0]):
-        wallet_name = f"Wallet {wallet_index}"
-        wallet_balances = final_balances.get(wallet_index, {})
-        report_lines = []
-        for net in networks.keys():
-            bal = wallet_balances.get(net, 0)
-            tx_count = tx_counts.get(net, 0)
-            report_lines.append(f"{net}: {bal:.6f} ETH, {tx_count} tx")
-        report_str = "; ".join(report_lines)
-        print(f"{wallet_name}: {report_str}")
+    print_report(store, wallets, final_balances, networks)
+    if simulation:
+        simulation.report()
 
-    input("\nНажмите Enter, чтобы выйти...")
+    if not args.yes:
+        input("\nНажмите Enter, чтобы выйти...")
@@ -0,0 +1,249 @@
+import concurrent.futures
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Менеджер прокси: проверка при старте и в фоне, EWMA задержки и доли ошибок,
+# выбор быстрых прокси, карантин сбойных, закрепление прокси за кошельком.
+########################################
+PROBE_TIMEOUT = 5             # таймаут проверки прокси, секунд
+PROBE_INTERVAL = 60           # период фоновой перепроверки, секунд
+EWMA_ALPHA = 0.3              # вес нового замера в скользящем среднем
+FAILURE_THRESHOLD = 0.5       # доля ошибок (EWMA), после которой прокси уходит в карантин
+QUARANTINE_SECONDS = 30       # первый карантин; каждый следующий подряд - вдвое дольше
+MAX_QUARANTINE_SECONDS = 600
+PROXY_ERRORS = (requests.exceptions.ProxyError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def parse_proxy_line(line):
+    # host:port:username:password, host:port или готовый URL (http://, socks5://)
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if "://" in line:
+        return line
+    parts = line.split(":")
+    if len(parts) == 4 and parts[1].isdigit():
+        host, port, username, password = parts
+        return f"http://{username}:{password}@{host}:{port}"
+    if len(parts) == 2 and parts[1].isdigit():
+        return f"http://{parts[0]}:{parts[1]}"
+    return None
+
+
+def load_proxies(filename="proxies.txt"):
+    proxies = []
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            for line_number, line in enumerate(f, start=1):
+                proxy_url = parse_proxy_line(line)
+                if proxy_url:
+                    proxies.append(proxy_url)
+                elif line.strip() and not line.strip().startswith("#"):
+                    logger.warning(f"{filename}:{line_number}: неверный формат прокси, строка пропущена")
+    return proxies
+
+
+class ProxyStats:
+    __slots__ = ("latency", "failure", "quarantined_until", "strikes", "measured")
+
+    def __init__(self):
+        self.latency = None  # EWMA задержки, секунд (None - ещё не измерялась)
+        self.failure = 0.0   # EWMA доли ошибок
+        self.quarantined_until = 0.0
+        self.strikes = 0     # сколько раз подряд прокси уходил в карантин
+        self.measured = False  # были ли замеры в этом запуске (история прошлых не считается)
+
+
+class ProxyManager:
+    def __init__(self, proxies, probe_url=None, sticky=False):
+        self.proxies = list(dict.fromkeys(proxies))
+        self.probe_url = probe_url
+        self.sticky_enabled = sticky
+        self.stats = {proxy: ProxyStats() for proxy in self.proxies}
+        self.pinned = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def __bool__(self):
+        return bool(self.proxies)
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def clear(self):
+        self.stop_event.set()
+        with self.lock:
+            self.proxies = []
+            self.stats = {}
+            self.pinned = {}
+
+    def seed_stats(self, history):
+        # история прошлых запусков {proxy: {"latency": ..., "failure": ...}} как стартовые оценки
+        with self.lock:
+            for proxy, entry in history.items():
+                stats = self.stats.get(proxy)
+                if stats is not None:
+                    stats.latency = entry.get("latency")
+                    stats.failure = entry.get("failure", 0.0)
+
+    def export_stats(self):
+        # только прокси, замеренные в этом запуске: неизмеренная история не должна выглядеть свежей
+        with self.lock:
+            return {proxy: {"latency": stats.latency, "failure": stats.failure}
+                    for proxy, stats in self.stats.items() if stats.measured}
+
+    def report(self, proxy, latency, ok, decisive=False):
+        # decisive - явная проверка: неудача сразу отправляет прокси в карантин
+        with self.lock:
+            stats = self.stats.get(proxy)
+            if stats is None:
+                return
+            stats.measured = True
+            stats.failure = (1 - EWMA_ALPHA) * stats.failure + EWMA_ALPHA * (0.0 if ok else 1.0)
+            if decisive and not ok:
+                stats.failure = max(stats.failure, FAILURE_THRESHOLD)
+            if ok:
+                stats.latency = latency if stats.latency is None else (1 - EWMA_ALPHA) * stats.latency + EWMA_ALPHA * latency
+                if stats.failure < FAILURE_THRESHOLD:
+                    stats.strikes = 0
+            elif stats.failure >= FAILURE_THRESHOLD and stats.quarantined_until <= time.monotonic():
+                duration = min(QUARANTINE_SECONDS * 2 ** stats.strikes, MAX_QUARANTINE_SECONDS)
+                stats.quarantined_until = time.monotonic() + duration
+                stats.strikes += 1
+                logger.warning(f"Прокси {proxy} в карантине на {duration} с (доля ошибок {stats.failure:.2f})")
+
+    def _score(self, proxy):
+        stats = self.stats[proxy]
+        latency = stats.latency if stats.latency is not None else PROBE_TIMEOUT / 2
+        return latency * (1 + 4 * stats.failure)
+
+    def choose(self, key=None, exclude=None):
+        key = key if key is not None else getattr(self.local, "key", None)
+        with self.lock:
+            if not self.proxies:
+                return None
+            now = time.monotonic()
+            healthy = [p for p in self.proxies if self.stats[p].quarantined_until <= now and p != exclude]
+            if not healthy:
+                # все в карантине - берём тот, чей карантин закончится раньше
+                return min(self.proxies, key=lambda p: self.stats[p].quarantined_until)
+            if self.sticky_enabled and key is not None:
+                pinned = self.pinned.get(key)
+                if pinned in healthy:
+                    return pinned
+            # выбор из двух случайных: нагрузка распределяется, но быстрые прокси в приоритете
+            candidates = random.sample(healthy, min(2, len(healthy)))
+            proxy = min(candidates, key=self._score)
+            if self.sticky_enabled and key is not None:
+                self.pinned[key] = proxy
+            return proxy
+
+    def next(self, failed):
+        # другой прокси вместо только что сбойного (закреплённый за ключом тоже меняется)
+        return self.choose(exclude=failed) if len(self.proxies) > 1 else failed
+
+    @contextlib.contextmanager
+    def sticky(self, key):
+        # весь трафик потока внутри блока идёт через прокси, закреплённый за key (например, адресом)
+        previous = getattr(self.local, "key", None)
+        self.local.key = key
+        try:
+            yield
+        finally:
+            self.local.key = previous
+
+    def call_sticky(self, key, func, *args, **kwargs):
+        with self.sticky(key):
+            return func(*args, **kwargs)
+
+    def probe(self, proxy):
+        payload = {"jsonrpc": "2.0", "id": 1, "method": "eth_chainId", "params": []}
+        started = time.monotonic()
+        try:
+            response = requests.post(self.probe_url, json=payload, proxies={"http": proxy, "https": proxy},
+                                     timeout=PROBE_TIMEOUT)
+            ok = response.status_code < 500 and response.status_code != 407
+        except requests.exceptions.RequestException:
+            ok = False
+        self.report(proxy, time.monotonic() - started, ok, decisive=True)
+        return ok
+
+    def probe_all(self):
+        proxies = list(self.proxies)
+        if not proxies or not self.probe_url:
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(proxies))) as executor:
+            results = list(executor.map(self.probe, proxies))
+        logger.info(f"Проверка прокси: доступно {sum(results)} из {len(results)}")
+
+    def start_background(self, interval=PROBE_INTERVAL):
+        def loop():
+            while not self.stop_event.wait(interval):
+                self.probe_all()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def request(self, method, url, proxies=None, **kwargs):
+        # запрос через выбранный прокси; при сбое прокси - повтор через другой
+        if proxies or not self.proxies:
+            return requests.request(method, url, proxies=proxies, **kwargs)
+        attempts = min(3, len(self.proxies))
+        proxy = self.choose()
+        for attempt in range(attempts):
+            if attempt:
+                proxy = self.next(proxy)
+            started = time.monotonic()
+            try:
+                response = requests.request(method, url, proxies={"http": proxy, "https": proxy}, **kwargs)
+            except PROXY_ERRORS:
+                self.report(proxy, time.monotonic() - started, False)
+                if attempt == attempts - 1:
+                    raise
+                continue
+            self.report(proxy, time.monotonic() - started, True)
+            return response
+
+
+class ProxiedHTTPProvider(Web3.HTTPProvider):
+    # HTTPProvider, выбирающий прокси на каждый запрос и сообщающий менеджеру о результате
+    def __init__(self, endpoint_uri, manager, **kwargs):
+        # встроенные повторы web3 шли бы через тот же прокси до того, как менеджер узнает о сбое
+        kwargs.setdefault("exception_retry_configuration", None)
+        super().__init__(endpoint_uri, **kwargs)
+        self.manager = manager
+        self.local = threading.local()
+
+    def get_request_kwargs(self):
+        kwargs = dict(super().get_request_kwargs())
+        proxy = getattr(self.local, "proxy", None)
+        if proxy:
+            kwargs["proxies"] = {"http": proxy, "https": proxy}
+        return kwargs
+
+    def make_request(self, method, params):
+        # при сбое прокси - один повтор через другой прокси
+        proxy = self.manager.choose()
+        for attempt in range(2):
+            if attempt:
+                proxy = self.manager.next(proxy)
+            self.local.proxy = proxy
+            started = time.monotonic()
+            try:
+                response = super().make_request(method, params)
+            except PROXY_ERRORS:
+                self.manager.report(proxy, time.monotonic() - started, False)
+                if attempt:
+                    raise
+                continue
+            self.manager.report(proxy, time.monotonic() - started, True)
+            return response
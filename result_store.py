@@ -0,0 +1,66 @@
+import csv
+import json
+import threading
+from dataclasses import asdict, dataclass, fields
+
+########################################
+# Хранилище результатов с индексом по кошельку и потоковой записью отчёта.
+# Каждый результат сразу пишется строкой в CSV/JSONL, в памяти остаётся
+# только сводка по кошельку, поэтому отчёт строится за линейное время.
+########################################
+
+
+@dataclass
+class TxResult:
+    wallet: str
+    chain: str
+    target: str
+    status: str
+    ok: bool = False
+    tx_count: int = 0
+    tx_hash: str = ""
+
+
+class WalletSummary:
+    __slots__ = ("results", "successes", "tx_counts")
+
+    def __init__(self):
+        self.results = 0
+        self.successes = 0
+        self.tx_counts = {}  # chain -> количество транзакций
+
+
+class ResultStore:
+    def __init__(self, path=None):
+        self.summaries = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.writer = None
+        if path:
+            self.file = open(path, "w", newline="", encoding="utf-8")
+            if path.lower().endswith(".csv"):
+                self.writer = csv.DictWriter(self.file, fieldnames=[f.name for f in fields(TxResult)])
+                self.writer.writeheader()
+
+    def add(self, result):
+        with self.lock:
+            summary = self.summaries.get(result.wallet)
+            if summary is None:
+                summary = self.summaries[result.wallet] = WalletSummary()
+            summary.results += 1
+            summary.successes += result.ok
+            summary.tx_counts[result.chain] = summary.tx_counts.get(result.chain, 0) + result.tx_count
+            if self.writer is not None:
+                self.writer.writerow(asdict(result))
+                self.file.flush()
+            elif self.file is not None:
+                self.file.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+                self.file.flush()
+
+    def summary(self, wallet):
+        return self.summaries.get(wallet) or WalletSummary()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
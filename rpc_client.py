@@ -0,0 +1,149 @@
+import itertools
+import json
+import threading
+import time
+
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+########################################
+# Лёгкий JSON-RPC клиент для горячих методов (eth_sendRawTransaction,
+# eth_getTransactionCount, eth_gasPrice) в обход middleware/форматтеров web3.
+# Всё остальное по-прежнему идёт через web3.
+########################################
+RESULT_MARKER = b'"result":"'
+
+
+class RPCError(Exception):
+    # текст ошибки узла сохраняется как есть: проверки вида "nonce too low" in str(e) работают
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _hex_result(body):
+    # ответ вида {"jsonrpc":"2.0","id":1,"result":"0x..."} разбирается без полного JSON-декодирования
+    start = body.find(RESULT_MARKER)
+    if start != -1:
+        start += len(RESULT_MARKER)
+        end = body.find(b'"', start)
+        if end != -1:
+            return body[start:end].decode()
+    result = _result(_loads(body))
+    if result is None:
+        raise RPCError(None, "null result")
+    return result
+
+
+def _is_rpc_body(body):
+    # HTTP 4xx/5xx с телом JSON-RPC (ошибка узла) - это ответ узла, а не сбой транспорта
+    try:
+        payload = _loads(body)
+    except ValueError:
+        return False
+    return isinstance(payload, list) or (isinstance(payload, dict) and "error" in payload)
+
+
+def _result(response):
+    error = response.get("error")
+    if error:
+        raise RPCError(error.get("code"), error.get("message", str(error)))
+    return response.get("result")
+
+
+class FastRPC:
+    def __init__(self, endpoint, proxy_manager=None, timeout=30):
+        self.endpoint = endpoint
+        self.proxy_manager = proxy_manager
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        # заранее собранные фрагменты тел запросов горячих методов
+        self.send_raw_prefix = b'","method":"eth_sendRawTransaction","params":["0x'
+        self.nonce_prefix = b'","method":"eth_getTransactionCount","params":["'
+        self.gas_price_suffix = b'","method":"eth_gasPrice","params":[]}'
+
+    @property
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["Content-Type"] = "application/json"
+            self.local.session = session
+        return session
+
+    def post(self, body):
+        proxy = self.proxy_manager.choose() if self.proxy_manager else None
+        proxies = {"http": proxy, "https": proxy} if proxy else None
+        started = time.monotonic()
+        try:
+            response = self.session.post(self.endpoint, data=body, proxies=proxies, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            if proxy:
+                self.proxy_manager.report(proxy, time.monotonic() - started, False)
+            raise
+        if proxy:
+            self.proxy_manager.report(proxy, time.monotonic() - started, True)
+        if response.status_code >= 400 and not _is_rpc_body(response.content):
+            response.raise_for_status()
+        return response.content
+
+    def _request_id(self):
+        return str(next(self.ids)).encode()
+
+    def call(self, method, params=()):
+        payload = {"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": list(params)}
+        return _result(_loads(self.post(_dumps(payload))))
+
+    def batch(self, calls):
+        # [(method, params), ...] -> [результат или RPCError, ...] в исходном порядке
+        payload = [
+            {"jsonrpc": "2.0", "id": offset, "method": method, "params": list(params)}
+            for offset, (method, params) in enumerate(calls)
+        ]
+        responses = _loads(self.post(_dumps(payload)))
+        if isinstance(responses, dict):  # узел отклонил батч целиком
+            error = responses.get("error") or {}
+            return [RPCError(error.get("code"), error.get("message", str(responses))) for _ in calls]
+        by_id = {response.get("id"): response for response in responses}
+        results = []
+        for offset in range(len(calls)):
+            response = by_id.get(offset)
+            if response is None:
+                results.append(RPCError(None, "missing response in batch"))
+            elif response.get("error"):
+                error = response["error"]
+                results.append(RPCError(error.get("code"), error.get("message", str(error))))
+            else:
+                results.append(response.get("result"))
+        return results
+
+    def send_raw_transaction(self, raw_transaction):
+        body = b'{"jsonrpc":"2.0","id":"' + self._request_id() + self.send_raw_prefix + bytes(raw_transaction).hex().encode() + b'"]}'
+        return _hex_result(self.post(body))
+
+    def get_transaction_count(self, address, block="pending"):
+        body = (b'{"jsonrpc":"2.0","id":"' + self._request_id() + self.nonce_prefix
+                + address.encode() + b'","' + block.encode() + b'"]}')
+        return int(_hex_result(self.post(body)), 16)
+
+    def gas_price(self):
+        body = b'{"jsonrpc":"2.0","id":"' + self._request_id() + self.gas_price_suffix
+        return int(_hex_result(self.post(body)), 16)
@@ -0,0 +1,204 @@
+import collections
+import logging
+import threading
+import time
+
+from tx_submitter import (ALREADY_KNOWN, INSUFFICIENT_FUNDS, NONCE_TOO_LOW, OTHER, TRANSPORT, UNDERPRICED,
+                          TxSubmitError, classify_submit_error)
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Общая машина состояний отправки: ошибка RPC классифицируется в действие.
+# Ошибки узла (цена, nonce, прочие) расходуют бюджет повторов кошелька и
+# ограничены по частоте на эндпоинт; сетевые ошибки бюджет не тратят - их гасит
+# circuit breaker эндпоинта, а отправители ждут его закрытия.
+# Nonce никогда не пропускается: при исчерпании бюджета кошелёк в сети останавливается.
+########################################
+DONE = "done"              # узел уже знает транзакцию - считать отправленной
+RESYNC = "resync"          # nonce устарел - перечитать pending nonce
+REPRICE = "reprice"        # повторить ту же транзакцию с повышенной ценой газа
+RETRYABLE = "retryable"    # повторить ту же транзакцию после паузы
+TERMINAL = "terminal"      # повторять бессмысленно - остановить кошелёк в этой сети
+
+TERMINAL_PATTERNS = ("invalid sender", "invalid chain id", "intrinsic gas too low", "exceeds block gas limit",
+                     "transaction type not supported", "invalid signature")
+ACTIONS = {
+    ALREADY_KNOWN: DONE,
+    NONCE_TOO_LOW: RESYNC,
+    UNDERPRICED: REPRICE,
+    INSUFFICIENT_FUNDS: TERMINAL,
+    TRANSPORT: RETRYABLE,
+}
+
+WALLET_RETRIES = 10        # повторов на кошелёк в сети; успешная отправка возвращает половину попытки
+ENDPOINT_RETRY_RATE = 2.0  # повторов в секунду на эндпоинт от всех кошельков вместе
+ENDPOINT_RETRY_BURST = 20
+RETRY_DELAY = 3            # первая пауза перед повтором; каждая следующая подряд - вдвое дольше
+MAX_RETRY_DELAY = 30
+GAS_BUMP = 1.2             # множитель цены газа при REPRICE
+BREAKER_THRESHOLD = 5      # сетевых ошибок подряд, после которых эндпоинт отключается
+BREAKER_COOLDOWN = 10      # первое отключение; каждое следующее подряд - вдвое дольше
+MAX_BREAKER_COOLDOWN = 120
+BREAKER_MAX_STRIKES = 6    # отключений подряд (~6 минут недоступности), после которых отправка прекращается
+COUNTED_BATCHES = 256      # сколько последних сбойных батчей помнить, чтобы не считать их повторно
+
+
+def classify(error):
+    kind = error.kind if isinstance(error, TxSubmitError) else classify_submit_error(str(error))
+    if kind == OTHER and any(pattern in str(error).lower() for pattern in TERMINAL_PATTERNS):
+        return TERMINAL
+    return ACTIONS.get(kind, RETRYABLE)
+
+
+def is_transport_error(error):
+    if isinstance(error, TxSubmitError):
+        return error.kind == TRANSPORT
+    # ожидание чека (TimeoutError) - не сбой эндпоинта; ошибки requests наследуют OSError
+    return isinstance(error, OSError) and not isinstance(error, TimeoutError)
+
+
+class RetryBudget:
+    def __init__(self, capacity, refill):
+        self.capacity = capacity
+        self.refill = refill
+        self.tokens = float(capacity)
+        self.lock = threading.Lock()
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.refill)
+
+
+class RetryThrottle:
+    # токен-бакет повторов эндпоинта: при шторме ошибок повторы ждут, а не останавливают кошельки
+    def __init__(self, rate=ENDPOINT_RETRY_RATE, burst=ENDPOINT_RETRY_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.failures = 0
+        self.strikes = 0
+        self.open_until = 0.0
+        self.counted = collections.deque(maxlen=COUNTED_BATCHES)
+        self.lock = threading.Lock()
+
+    @property
+    def dead(self):
+        return self.strikes >= BREAKER_MAX_STRIKES
+
+    def wait(self):
+        # пока эндпоинт отключён, отправители ждут, а не тратят повторы
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record(self, ok, batch=None):
+        with self.lock:
+            if ok:
+                self.failures = 0
+                self.strikes = 0
+                return
+            if batch is not None:
+                if batch in self.counted:
+                    return  # этот батч уже засчитан другим его элементом
+                self.counted.append(batch)
+            self.failures += 1
+            if self.failures < BREAKER_THRESHOLD:
+                return
+            cooldown = min(BREAKER_COOLDOWN * 2 ** self.strikes, MAX_BREAKER_COOLDOWN)
+            self.open_until = time.monotonic() + cooldown
+            self.failures = BREAKER_THRESHOLD - 1  # после паузы одна ошибка снова отключит эндпоинт
+            self.strikes += 1
+        logger.warning(f"{self.endpoint}: {BREAKER_THRESHOLD} сетевых ошибок подряд, эндпоинт отключён на {cooldown} с")
+
+
+BREAKERS = {}
+THROTTLES = {}
+ENDPOINTS_LOCK = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with ENDPOINTS_LOCK:
+        breaker = BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = BREAKERS[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def get_throttle(endpoint):
+    with ENDPOINTS_LOCK:
+        throttle = THROTTLES.get(endpoint)
+        if throttle is None:
+            throttle = THROTTLES[endpoint] = RetryThrottle()
+        return throttle
+
+
+class SendState:
+    # состояние отправки одного кошелька в одной сети
+    def __init__(self, endpoint, retries=WALLET_RETRIES):
+        self.breaker = get_breaker(endpoint)
+        self.throttle = get_throttle(endpoint)
+        self.budget = RetryBudget(retries, 0.5)
+        self.consecutive = 0
+        self.reason = None  # причина остановки для TERMINAL
+
+    def before_send(self):
+        self.breaker.wait()
+
+    def on_success(self):
+        self.breaker.record(True)
+        self.budget.deposit()
+        self.consecutive = 0
+
+    def on_error(self, error):
+        action = classify(error)
+        if is_transport_error(error):
+            # сетевой сбой - забота circuit breaker: бюджет не тратится, before_send дождётся эндпоинта
+            self.breaker.record(False, getattr(error, "batch", None))
+            if self.breaker.dead:
+                self.reason = f"эндпоинт недоступен ({error})"
+                return TERMINAL
+            return RETRYABLE
+        self.breaker.record(True)  # узел ответил - эндпоинт жив
+        if action == TERMINAL:
+            self.reason = str(error)
+        elif action in (REPRICE, RETRYABLE, RESYNC):
+            if not self.budget.withdraw():
+                self.reason = f"исчерпан бюджет повторов ({error})"
+                return TERMINAL
+            self.throttle.acquire()
+            self.consecutive += 1
+        return action
+
+    def backoff(self):
+        # после сетевого сбоя пауза не нужна: её задаёт before_send (ожидание circuit breaker)
+        return min(RETRY_DELAY * 2 ** max(self.consecutive - 1, 0), MAX_RETRY_DELAY) if self.consecutive else 0
@@ -0,0 +1,193 @@
+import argparse
+import json
+import statistics
+import threading
+import time as real_time
+
+import requests
+
+import block_clock
+import chain_cache
+import send_state
+import tx_submitter
+from mock_rpc import MockRPCServer
+
+########################################
+# Режим симуляции (--simulate) для всех трёх скриптов.
+# Вся логика (планирование, nonce, газ, котировки) выполняется как обычно,
+# но RPC и Li.Fi подменяются локальной заглушкой цепочки (или форком),
+# которая добавляет задержки из профиля и считает вызовы, газ и стоимость.
+# Время ускорено в 1/time_scale раз: задержки, sleep и блоки сокращаются,
+# а часы скрипта показывают модельное время - ожидания растянуты обратно
+# в 1/time_scale раз, работа процессора скрипта (подпись, RLP, JSON) учтена как есть;
+# процессорное время потоков заглушки в прогноз не входит.
+# Прогноз в отчёте - это модельное время.
+########################################
+DEFAULT_TIME_SCALE = 0.1
+DEFAULT_BLOCK_TIME = 2.0  # время блока OP Stack сетей, секунд
+DEFAULT_LATENCY_PROFILE = {
+    "default": {
+        "default": 0.08,
+        "eth_sendRawTransaction": 0.15,
+        "eth_getTransactionReceipt": 0.1,
+    },
+    "lifi": {"quote": 0.8},
+}
+PROFILE_METHODS = ["eth_chainId", "eth_blockNumber", "eth_gasPrice", "eth_getBalance", "eth_getTransactionCount"]
+PROBE_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class ScaledTime:
+    # подменяет модуль time в скрипте: sleep короче, monotonic/time показывают модельное время
+    def __init__(self, scale, stub_cpu_time=lambda: 0.0):
+        # stub_cpu_time - процессорное время заглушки в этом же процессе: в реальной сети эту работу
+        # делает узел, а его ответ уже учтён задержкой из профиля, поэтому в модельное время оно не входит
+        self.scale = scale
+        self.stub_cpu_time = stub_cpu_time
+        self.origin_monotonic = real_time.monotonic()
+        self.origin_time = real_time.time()
+        self.origin_cpu = real_time.process_time()
+        self.origin_stub = stub_cpu_time()
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def sleep(self, seconds):
+        real_time.sleep(seconds * self.scale)
+
+    def elapsed(self):
+        # ускорено только ожидание (реальное время минус процессорное); процессорное время скрипта не масштабируется.
+        # Под GIL процессорное время потоков почти не перекрывается, поэтому их сумма близка к настенной
+        wall = real_time.monotonic() - self.origin_monotonic
+        stub = self.stub_cpu_time() - self.origin_stub
+        cpu = real_time.process_time() - self.origin_cpu - stub
+        with self.lock:
+            self.last = max(self.last, cpu + max(wall - cpu - stub, 0.0) / self.scale)
+            return self.last
+
+    def monotonic(self):
+        return self.origin_monotonic + self.elapsed()
+
+    def time(self):
+        return self.origin_time + self.elapsed()
+
+    def __getattr__(self, name):
+        return getattr(real_time, name)
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("симуляция")
+    group.add_argument("--simulate", action="store_true", help="прогон без реальных средств с прогнозом времени и стоимости")
+    group.add_argument("--fork", action="append", default=[], metavar="CHAIN_ID=URL",
+                       help="локальный форк (anvil --fork-url ...) для сети вместо заглушки")
+    group.add_argument("--latency-profile", help="JSON профиль задержек (см. python simulate.py record)")
+    group.add_argument("--time-scale", type=float, default=DEFAULT_TIME_SCALE,
+                       help="во сколько раз ускорять время (0.1 = в 10 раз быстрее)")
+    group.add_argument("--sim-balance", type=float, default=1.0, help="стартовый баланс адресов на заглушке, ETH")
+
+
+class Simulation:
+    def __init__(self, args, module):
+        profile = DEFAULT_LATENCY_PROFILE
+        if args.latency_profile:
+            with open(args.latency_profile, "r") as f:
+                profile = json.load(f)
+        self.time_scale = args.time_scale
+        self.server = MockRPCServer(("127.0.0.1", 0), int(args.sim_balance * 10 ** 18), profile, self.time_scale)
+        for chain_id, gas_price in profile.get("gas_price", {}).items():
+            self.server.gas_prices[int(chain_id)] = gas_price
+        for fork in args.fork:
+            chain_id, url = fork.split("=", 1)
+            self.server.forks[int(chain_id)] = url
+        self.server.start()
+        self.server.start_block_producer(profile.get("block_time", DEFAULT_BLOCK_TIME) * self.time_scale)
+        self.endpoints = {}  # путь на заглушке -> исходный RPC (для отчёта об узких местах)
+        chain_cache.use_memory_cache()
+        self.clock = ScaledTime(self.time_scale, lambda: self.server.cpu_time)
+        module.time = self.clock
+        block_clock.time = module.time
+        send_state.time = module.time
+        tx_submitter.DEFAULT_LINGER *= self.time_scale
+
+    def rpc_for(self, config):
+        path = str(config["chain_id"])
+        self.endpoints[path] = config["rpc"]
+        return f"{self.server.url}/{path}"
+
+    def networks(self, networks):
+        # WebSocket эндпоинты реальных сетей в симуляции не используются - часы блоков опрашивают заглушку
+        return {
+            name: dict({k: v for k, v in config.items() if k != "ws"}, rpc=self.rpc_for(config))
+            for name, config in networks.items()
+        }
+
+    @property
+    def quote_url(self):
+        return f"{self.server.url}/v1/quote"
+
+    def report(self, log=print):
+        elapsed = self.clock.elapsed()
+        chains = sorted(self.server.chains.values(), key=lambda c: c.chain_id)
+        total_tx = sum(chain.tx_count for chain in chains)
+        log("\n=== Симуляция: прогноз ===")
+        log(f"Длительность (модельное время): {elapsed:.1f} с, транзакций: {total_tx}, "
+            f"пропускная способность: {total_tx / elapsed if elapsed else 0:.2f} tx/s")
+        calls_by_path = {}
+        for (path, method), (count, latency) in self.server.calls.items():
+            calls, busy = calls_by_path.get(path, (0, 0.0))
+            calls_by_path[path] = (calls + count, busy + latency)
+        for chain in chains:
+            path = str(chain.chain_id)
+            calls, _ = calls_by_path.get(path, (0, 0.0))
+            fork_note = " (форк, газ по лимиту)" if chain.chain_id in self.server.forks else ""
+            log(f"chain {chain.chain_id}: {chain.tx_count} tx, {chain.tx_count / elapsed if elapsed else 0:.2f} tx/s, "
+                f"газ {chain.gas_used}, комиссии {chain.fees_paid / 10 ** 18:.8f} ETH, "
+                f"переведено {chain.value_sent / 10 ** 18:.6f} ETH, RPC вызовов {calls}{fork_note}")
+        total_busy = sum(busy for _, busy in calls_by_path.values())
+        log("Узкие места (суммарное время ожидания ответов):")
+        for path, (calls, busy) in sorted(calls_by_path.items(), key=lambda x: -x[1][1])[:3]:
+            share = busy / total_busy * 100 if total_busy else 0
+            endpoint = self.endpoints.get(path, "Li.Fi API" if path == "lifi" else path)
+            log(f"  {endpoint}: {calls} вызовов, {busy:.1f} с ({share:.0f}%)")
+        self.server.shutdown()
+
+
+def record_profile(rpcs, samples=5):
+    # замеряет реальные задержки read-only методов и gasPrice каждой сети
+    profile = {"default": DEFAULT_LATENCY_PROFILE["default"], "lifi": DEFAULT_LATENCY_PROFILE["lifi"], "gas_price": {}}
+    session = requests.Session()
+    for chain_id, rpc in rpcs.items():
+        chain_profile = {}
+        for method in PROFILE_METHODS:
+            params = [PROBE_ADDRESS, "latest"] if method in ("eth_getBalance", "eth_getTransactionCount") else []
+            timings = []
+            for i in range(samples):
+                started = real_time.monotonic()
+                response = session.post(rpc, json={"jsonrpc": "2.0", "id": i, "method": method, "params": params}, timeout=30)
+                timings.append(real_time.monotonic() - started)
+                if method == "eth_gasPrice":
+                    profile["gas_price"][chain_id] = int(response.json()["result"], 16)
+            chain_profile[method] = round(statistics.median(timings), 4)
+        # отправку и чеки замерить без реальных транзакций нельзя - берём самый медленный read-only метод
+        chain_profile["default"] = max(chain_profile.values())
+        chain_profile["eth_sendRawTransaction"] = chain_profile["default"]
+        profile[chain_id] = chain_profile
+        print(f"chain {chain_id}: {chain_profile}")
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись профиля задержек RPC для --simulate")
+    parser.add_argument("command", choices=["record"])
+    parser.add_argument("--rpc", action="append", required=True, metavar="CHAIN_ID=URL")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--output", default="latency_profile.json")
+    args = parser.parse_args()
+    rpcs = dict(item.split("=", 1) for item in args.rpc)
+    profile = record_profile(rpcs, args.samples)
+    with open(args.output, "w") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Профиль сохранён в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+import requests
+
+from chain_cache import get_chain_cache
+from rpc_client import FastRPC, RPCError
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Пакетная отправка eth_sendRawTransaction: подписанные транзакции для одного
+# эндпоинта собираются в JSON-RPC батчи (по размеру и времени ожидания),
+# ошибка каждого элемента батча возвращается именно той транзакции, что её вызвала.
+########################################
+DEFAULT_MAX_BATCH = 50     # максимум транзакций в одном HTTP запросе
+DEFAULT_LINGER = 0.02      # сколько ждать попутные транзакции после первой, секунд
+
+NONCE_TOO_LOW = "nonce_too_low"
+ALREADY_KNOWN = "already_known"
+UNDERPRICED = "underpriced"
+INSUFFICIENT_FUNDS = "insufficient_funds"
+TRANSPORT = "transport"
+OTHER = "other"
+
+ERROR_PATTERNS = (
+    (NONCE_TOO_LOW, ("nonce too low", "nonce is too low", "oldnonce")),
+    (ALREADY_KNOWN, ("already known", "alreadyknown", "known transaction", "already imported")),
+    (UNDERPRICED, ("underpriced", "fee too low", "max fee per gas less than block base fee", "gas price too low")),
+    (INSUFFICIENT_FUNDS, ("insufficient funds", "overshot")),
+)
+BATCH_UNSUPPORTED_CODES = (-32600, -32601)
+BATCH_LIMIT_PATTERNS = ("batch size", "batch limit", "batch too large", "too many requests in batch", "exceeds the batch")
+
+
+def classify_submit_error(message):
+    message = message.lower()
+    for kind, patterns in ERROR_PATTERNS:
+        if any(pattern in message for pattern in patterns):
+            return kind
+    return OTHER
+
+
+class TxSubmitError(Exception):
+    # текст ошибки узла сохраняется: проверки вида "nonce too low" in str(e) продолжают работать;
+    # batch - номер HTTP запроса: сбой одного батча засчитывается эндпоинту один раз
+    def __init__(self, kind, message, tx_hash=None, batch=None):
+        super().__init__(message)
+        self.kind = kind
+        self.tx_hash = tx_hash
+        self.batch = batch
+
+
+BATCH_IDS = itertools.count(1)
+
+
+class PendingSubmit:
+    __slots__ = ("raw", "tx_hash", "future")
+
+    def __init__(self, raw, tx_hash):
+        self.raw = raw
+        self.tx_hash = tx_hash
+        self.future = concurrent.futures.Future()
+
+
+class BatchSubmitter:
+    def __init__(self, rpc, max_batch=DEFAULT_MAX_BATCH, linger=None):
+        self.rpc = rpc
+        self.max_batch = max_batch
+        self.linger = DEFAULT_LINGER if linger is None else linger
+        self.queue = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _enqueue(self, raw_transaction, tx_hash):
+        if tx_hash is not None and not isinstance(tx_hash, str):
+            tx_hash = "0x" + bytes(tx_hash).hex()
+        item = PendingSubmit(bytes(raw_transaction), tx_hash)
+        with self.condition:
+            self.queue.append(item)
+            self.condition.notify()
+        return item
+
+    def submit(self, raw_transaction, tx_hash=None):
+        # -> Future с хэшем транзакции; при ошибке узла - TxSubmitError
+        return self._enqueue(raw_transaction, tx_hash).future
+
+    def send(self, raw_transaction, tx_hash=None, timeout=60):
+        item = self._enqueue(raw_transaction, tx_hash)
+        try:
+            return item.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            with self.condition:
+                queued = item in self.queue
+                if queued:
+                    self.queue.remove(item)
+            if queued:
+                # не отправлена и уже не будет: вызывающий может безопасно переподписать этот nonce
+                raise TxSubmitError(TRANSPORT, f"не отправлена за {timeout} с", item.tx_hash)
+            # уже в полёте: ждём её исход (ограничен таймаутом HTTP), иначе она уйдёт после отказа
+            return item.future.result()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                deadline = time.monotonic() + self.linger
+                while len(self.queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+            if batch:  # очередь могла опустеть: отправители с истёкшим таймаутом забирают свои транзакции
+                self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            results = self._send_batch(batch)
+        except Exception as e:
+            batch_id = next(BATCH_IDS)
+            for item in batch:
+                item.future.set_exception(TxSubmitError(TRANSPORT, str(e), item.tx_hash, batch_id))
+            return
+        for item, result in zip(batch, results):
+            if isinstance(result, RPCError):
+                kind = classify_submit_error(result.message or "")
+                if kind == ALREADY_KNOWN and item.tx_hash:
+                    item.future.set_result(item.tx_hash)  # узел уже принял ровно эту транзакцию
+                else:
+                    item.future.set_exception(TxSubmitError(kind, result.message, item.tx_hash))
+            else:
+                item.future.set_result(result)
+
+    def _send_batch(self, batch):
+        if len(batch) == 1:
+            return [self._send_single(batch[0])]
+        try:
+            results = self.rpc.batch([("eth_sendRawTransaction", ["0x" + item.raw.hex()]) for item in batch])
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 413:
+                return self._split(batch)
+            raise
+        if all(isinstance(r, RPCError) for r in results):
+            message = (results[0].message or "").lower()
+            if any(pattern in message for pattern in BATCH_LIMIT_PATTERNS):
+                return self._split(batch)
+            if all(r.code in BATCH_UNSUPPORTED_CODES for r in results):
+                logger.warning(f"{self.rpc.endpoint}: батчи не поддерживаются, отправка по одной")
+                self._learn_limit(1)
+                return [self._send_single(item) for item in batch]
+        return results
+
+    def _split(self, batch):
+        # превышен лимит батча (HTTP 413 или ошибка узла) - делим пополам и запоминаем лимит
+        half = len(batch) // 2
+        self._learn_limit(half)
+        logger.warning(f"{self.rpc.endpoint}: батч из {len(batch)} отклонён, лимит {self.max_batch}")
+        return self._send_batch(batch[:half]) + self._send_batch(batch[half:])
+
+    def _learn_limit(self, limit):
+        self.max_batch = min(self.max_batch, limit)
+        get_chain_cache().set_feature(self.rpc.endpoint, "batch_limit", self.max_batch)
+
+    def _send_single(self, item):
+        try:
+            return self.rpc.send_raw_transaction(item.raw)
+        except RPCError as e:
+            return e
+
+
+SUBMITTERS = {}
+SUBMITTERS_LOCK = threading.Lock()
+
+
+def get_submitter(rpc_url, proxy_manager=None):
+    # один отправщик на эндпоинт: транзакции всех потоков попадают в общие батчи;
+    # размер батча - из кэша возможностей эндпоинта, если он там уже известен
+    with SUBMITTERS_LOCK:
+        submitter = SUBMITTERS.get(rpc_url)
+        if submitter is None:
+            max_batch = get_chain_cache().feature(rpc_url, "batch_limit") or DEFAULT_MAX_BATCH
+            submitter = SUBMITTERS[rpc_url] = BatchSubmitter(FastRPC(rpc_url, proxy_manager), min(max_batch, DEFAULT_MAX_BATCH))
+        return submitter
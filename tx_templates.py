@@ -0,0 +1,121 @@
+import functools
+import logging
+import threading
+from collections import namedtuple
+
+from eth_account import Account
+from eth_hash.auto import keccak
+from eth_keys import keys
+from eth_utils import to_canonical_address
+
+logger = logging.getLogger(__name__)
+
+########################################
+# Шаблоны повторяющихся переводов (legacy, EIP-155).
+# Статические поля (gas, value, data, chainId) проверяются и RLP-кодируются
+# один раз на (сеть, кошелёк); адрес получателя берётся из ограниченного LRU-кэша,
+# на каждую транзакцию дописываются только nonce и gasPrice, после чего считается keccak и подпись. Шаблон сверяется с Account.sign_transaction
+# при создании; при расхождении используется обычная подпись через eth_account.
+########################################
+SignedTransfer = namedtuple("SignedTransfer", ["raw_transaction", "hash"])
+RECIPIENT_CACHE = 4096  # закодированных адресов получателей (рассылка может идти на сотни тысяч адресов)
+
+
+def rlp_int(value):
+    if value == 0:
+        return b"\x80"
+    if value < 0x80:
+        return bytes([value])
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return bytes([0x80 + len(data)]) + data
+
+
+def rlp_bytes(data):
+    if len(data) == 1 and data[0] < 0x80:
+        return data
+    return _rlp_length(len(data), 0x80) + data
+
+
+def rlp_list(payload):
+    return _rlp_length(len(payload), 0xc0) + payload
+
+
+def _rlp_length(length, offset):
+    if length < 56:
+        return bytes([offset + length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([offset + 55 + len(encoded)]) + encoded
+
+
+@functools.lru_cache(maxsize=RECIPIENT_CACHE)
+def rlp_address(to):
+    # проверка checksum и кодирование адреса; общий кэш всех шаблонов, размер ограничен
+    return rlp_bytes(to_canonical_address(to))
+
+
+class TransferTemplate:
+    def __init__(self, private_key, chain_id, value, gas=21000, data=b""):
+        account = Account.from_key(private_key)
+        self.private_key = account.key
+        self.signer = keys.PrivateKey(bytes(account.key))
+        self.address = account.address
+        self.chain_id = chain_id
+        self.value = value
+        self.gas = gas
+        self.data = bytes(data)
+        self.chain_suffix = rlp_int(chain_id) + b"\x80\x80"  # chainId, 0, 0 для хэша подписи (EIP-155)
+        self.v_offset = chain_id * 2 + 35
+        self.gas_field = rlp_int(gas)
+        self.tail = rlp_int(value) + rlp_bytes(self.data)  # value, data
+        self.fast = self._self_check()
+
+    def _self_check(self):
+        # подпись детерминирована (RFC 6979), поэтому байты обязаны совпасть с eth_account
+        try:
+            expected = self._sign_slow(1, 10 ** 9, self.address).raw_transaction
+            actual = self._sign_fast(1, 10 ** 9, self.address).raw_transaction
+        except Exception as e:
+            logger.warning(f"Шаблон транзакций для chain {self.chain_id}: {e}, используется eth_account")
+            return False
+        if bytes(expected) != actual:
+            logger.warning(f"Шаблон транзакций для chain {self.chain_id} не совпал с eth_account, используется eth_account")
+            return False
+        return True
+
+    def sign(self, nonce, gas_price, to):
+        if self.fast:
+            return self._sign_fast(nonce, gas_price, to)
+        return self._sign_slow(nonce, gas_price, to)
+
+    def _sign_fast(self, nonce, gas_price, to):
+        prefix = rlp_int(nonce) + rlp_int(gas_price) + self.gas_field + rlp_address(to) + self.tail
+        signature = self.signer.sign_msg_hash(keccak(rlp_list(prefix + self.chain_suffix)))
+        raw = rlp_list(prefix + rlp_int(self.v_offset + signature.v) + rlp_int(signature.r) + rlp_int(signature.s))
+        return SignedTransfer(raw, keccak(raw))
+
+    def _sign_slow(self, nonce, gas_price, to):
+        tx = {
+            'nonce': nonce,
+            'to': to,
+            'value': self.value,
+            'gas': self.gas,
+            'gasPrice': gas_price,
+            'data': self.data,
+            'chainId': self.chain_id
+        }
+        signed = Account.sign_transaction(tx, self.private_key)
+        return SignedTransfer(bytes(signed.raw_transaction), bytes(signed.hash))
+
+
+TEMPLATES = {}
+TEMPLATES_LOCK = threading.Lock()
+
+
+def get_template(chain_id, private_key, value, gas=21000):
+    # один шаблон на (сеть, кошелёк, сумма, газ)
+    key = (chain_id, private_key, value, gas)
+    with TEMPLATES_LOCK:
+        template = TEMPLATES.get(key)
+        if template is None:
+            template = TEMPLATES[key] = TransferTemplate(private_key, chain_id, value, gas)
+        return template